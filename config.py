@@ -3,7 +3,7 @@ Unified configuration system for the GA4 + Marketing Pixel Logger.
 Replaces both config.py and config.json with a single source of truth.
 """
 
-from typing import Dict, Set, NamedTuple, Optional
+from typing import Dict, FrozenSet, Set, NamedTuple, Optional
 from config_loader import (
     get_config, get_platform_color, get_platform_config, get_all_platform_configs,
     get_server_tracking_config, get_all_hosts, get_all_paths, get_platforms_dict,
@@ -56,6 +56,8 @@ SGTM_INDICATORS = {
     'timestampParams': sgtm_indicators.get('timestampParams', ['timestamp', 'time', 't', '_p', 'ts']),
     'serverGtmParams': sgtm_indicators.get('serverGtmParams', ['gtm', 'container_id', 'gtm_container', 'server_container_url'])
 }
+# Freeze every category - membership tests and intersections against request params run in C
+SGTM_INDICATORS: Dict[str, FrozenSet[str]] = {category: frozenset(values) for category, values in SGTM_INDICATORS.items()}
 
 # Platform highlighting configuration from centralized config
 def get_platform_highlight_info(platform: str) -> Dict[str, str]:
@@ -6,26 +6,48 @@ import time
 import os
 import re
 import hashlib
-from typing import Dict, List, Optional, Union
+import collections
+import functools
+import socket
+import threading
+import types
+from typing import Dict, FrozenSet, Iterator, List, Mapping, Optional, Union
+
+try:
+    import orjson  # Optional: faster structured log serialization
+except ImportError:
+    orjson = None
+
+# Small JSON values embedded in pixel params; orjson parses these noticeably faster
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+try:
+    import xxhash  # Optional: faster request/response matching hashes
+except ImportError:
+    xxhash = None
+
+try:
+    import ahocorasick  # Optional: single-pass tracking path segment matching
+except ImportError:
+    ahocorasick = None
+
 from config import (
     PLATFORMS, ALL_HOSTS, ALL_PATHS, 
     SERVER_TRACKING_PATTERNS, ALL_HOST_PATTERNS, SGTM_INDICATORS,
     get_platform_highlight_info, get_websocket_port, is_debug_mode
 )
 
-# Force unbuffered output
-sys.stdout.reconfigure(line_buffering=True)
-
 # Load centralized configuration
 DEBUG_MODE = is_debug_mode()
 WEBSOCKET_PORT = get_websocket_port()
 
 
-EVENT_PARAMS: List[tuple] = [
+EVENT_PARAMS: tuple = (
     ('gcs', 'GCS'), ('ep.decision_id', 'decision_id'), ('ep.slot_id', 'slot_id'),
     ('ep.item_name', 'item_name'), ('ep.type', 'type'), ('ep.hostname', 'hostname'),
     ('ep.dy_user', 'dy_user'), ('ep.dy_session', 'dy_session')
-]
+)
+EVENT_PARAM_MAX_LENGTH = 50
 
 # Platform formatting rules for pixel IDs
 PLATFORM_ID_FORMATTERS = {
@@ -47,10 +69,196 @@ PLATFORM_ID_FORMATTERS = {
     "Microsoft/Bing": lambda pid: ("Bing UET Tag ID", "UET") if pid.isdigit() else None
 }
 
+# GA4 paths served from regional Google Analytics hosts
+_REGIONAL_GA4_PATHS = ("/g/collect", "/g/s/collect", "/collect", "/r/collect", "/gtag/js", "/mp/collect", "/td")
+
+# Regional Google Analytics hosts: region1.analytics.google.com, eu2.google-analytics.com, asia1..., etc.
+_REGIONAL_GA4_HOST_RE = re.compile(r"^(?:region\d+|[a-z]{2,5}\d*)\.(?:analytics\.google|google-analytics)\.com$")
+
+# Google Ads conversion/remarketing paths carrying the AdWords ID - one pass over the path
+_ADWORDS_ID_RE = re.compile(r'/(?:pagead/(?:1p-conversion|conversion|1p-user-list)|ads/conversion)/(\d+)(?:/|\?|$)')
+
+# CMP hostname fragment -> provider, first match wins
+CMP_PROVIDERS = {
+    "usercentrics": "Usercentrics",
+    "cookielaw.org": "OneTrust",
+    "onetrust.com": "OneTrust",
+    "optanon": "OneTrust",
+    "cookiebot.com": "Cookiebot",
+    "consentmanager": "ConsentManager",
+    "consensu.org": "ConsentManager",
+    "iubenda.com": "Iubenda",
+    "cookie-script.com": "CookieScript",
+    "cdn.cookie-script.com": "CookieScript",
+    "consent.cookie-script.com": "CookieScript",
+    "quantcast.com": "Quantcast",
+    "trustarc.com": "TrustArc",
+    "didomi": "Didomi"
+}
+
+# CMP path markers in priority order -> (event name suffix, event type); None marks the API
+# group, which the handler refines further. Plain substring loops beat a combined regex here.
+_CMP_PATH_RULES = (
+    (("/browser-ui/", "/otnotice/", "/cc.js", "/cs.js", "/uc.js"), ("Banner Load", "Banner Display")),
+    (("/api/", "/consent/", "/groups/", "/choice.js"), None),
+    (("/settings/", "/latest/", "/scripttemplates/"), ("Configuration", "Settings")),
+    (("/privacy-notice/", "/cookie-policy/"), ("Policy Load", "Policy Display"))
+)
+
+# Privacy Sandbox endpoint -> event name, most specific first
+SANDBOX_EVENTS = {
+    "/privacy_sandbox/topics/registration": "Topics Registration",
+    "/privacy_sandbox/pixel/register/trigger": "Pixel Registration",
+    "/privacy_sandbox/topics/": "Topics API",
+    "/privacy_sandbox/fledge/": "FLEDGE",
+    "/privacy_sandbox/attribution_reporting/": "Attribution Reporting",
+    "/privacy_sandbox/trust_tokens/": "Trust Tokens",
+    "/privacy_sandbox/private_aggregation/": "Private Aggregation",
+    "/privacy_sandbox/shared_storage/": "Shared Storage",
+    "/privacy_sandbox/": "Privacy Sandbox"
+}
+_SANDBOX_GOOGLE_HOSTS = ("google.com", "doubleclick.net", "googlesyndication.com", "region1.google-analytics.com")
+
+# Facebook standard event name -> event type (anything else is a custom event)
+FB_EVENT_TYPES = {
+    "PageView": "Page Tracking",
+    "Purchase": "E-commerce", "InitiateCheckout": "E-commerce", "AddToCart": "E-commerce",
+    "Lead": "Conversion", "CompleteRegistration": "Conversion", "Subscribe": "Conversion",
+    "ViewContent": "Engagement", "Search": "Engagement", "AddToWishlist": "Engagement"
+}
+
+# Parameters that drive LinkedIn fallback classification
+_LI_CLASSIFY_PARAMS = frozenset(("conversionId", "eventId", "v", "url", "tm"))
+
+# LinkedIn URL keywords in priority order -> (event name, event type)
+_LI_URL_EVENTS = (
+    (("checkout", "purchase", "order"), ("Purchase Page", "E-commerce Tracking")),
+    (("cart", "basket"), ("Cart Page", "E-commerce Tracking")),
+    (("contact", "form"), ("Lead Page", "Lead Generation")),
+    (("signup", "register"), ("Registration Page", "Registration Tracking")),
+    (("demo", "trial"), ("Demo Request", "Lead Generation")),
+    (("download",), ("Download Page", "Content Engagement"))
+)
+
+# Enhanced Ecommerce product field prefixes (pr1=nmShoe~pr99.5) -> product info keys
+_PRODUCT_PREFIX_MAP = {'nm': 'name', 'id': 'id', 'pr': 'price', 'br': 'brand', 'ca': 'category', 'qt': 'quantity'}
+
+# CCM consent state (gcs) markers in priority order -> (event name, event type)
+_CCM_CONSENT_EVENTS = (
+    ("G1", ("Consent Granted", "Consent Update")),
+    ("G0", ("Consent Denied", "Consent Update"))
+)
+
+# CCM privacy signal parameters checked when no consent state is sent
+_CCM_SIGNAL_EVENTS = (
+    ("gdpr", ("GDPR Compliance Check", "Privacy Compliance")),
+    ("dma", ("DMA Consent Processing", "Privacy Compliance"))
+)
+
+# Platforms whose handlers only read URL parameters - POST bodies are not parsed.
+# Clarity uploads compressed session recordings that carry no tracking parameters.
+PLATFORM_NEEDS_BODY = {
+    "Microsoft Clarity": False
+}
+
+# Internal keys the request processor adds to params for the platform handlers
+_REQUEST_METADATA_KEYS = ("_request_path", "_request_host", "_request_url")
+
+# Marker returned by the request processor when a POST body is not JSON
+_NOT_JSON = object()
+
+# Structured log timestamps stay float epoch seconds - the overlay multiplies them by 1000
+_wall_clock = time.time
+
+# Maximum delay before buffered log lines are written to stdout
+LOG_FLUSH_INTERVAL = 0.01
+
+# Buffered log bytes that trigger an immediate flush
+LOG_BUFFER_SIZE = 65536
+
+def _index_platforms_by_host() -> Dict[str, List[tuple]]:
+    """Map each host to its (platform, paths) candidates in PLATFORMS order"""
+    index = {}
+    for platform_name, platform_config in PLATFORMS.items():
+        for host in platform_config.hosts:
+            index.setdefault(host, []).append((platform_name, tuple(platform_config.paths)))
+    return index
+
+# Standard detection only visits the platforms serving the request host
+_PLATFORMS_BY_HOST = _index_platforms_by_host()
+
+# Pixel ID / event name keys across all platforms -> number of platforms using them
+_PLATFORM_KEY_PARAM_COUNTS = collections.Counter(
+    key for platform_config in PLATFORMS.values() for key in (platform_config.pixel_id_key, platform_config.event_name_key)
+)
+
+# GA4 JSON field -> parameter mapping used for every event of a batched payload
+_GA4_PARAM_MAP = PLATFORMS["GA4"].param_map
+
+# Prefix collections as tuples - str.startswith checks them all in one C call
+_ALL_PATHS_PREFIXES = tuple(ALL_PATHS)
+
+def _minimal_path_segments() -> tuple:
+    """Tracking paths without trailing slashes, dropping any segment that contains a shorter one (e.g. "/api" covers "/api/v1/pixel/track")"""
+    segments = set(tracking_path.rstrip('/') for tracking_path in ALL_PATHS)
+    return tuple(sorted(segment for segment in segments
+                        if not any(other != segment and other in segment for other in segments)))
+
+# Tracking path segments matched anywhere in a request path
+_ALL_PATHS_SEGMENTS = _minimal_path_segments()
+
+def _build_path_segment_automaton():
+    """Aho-Corasick automaton over the tracking path segments, None without pyahocorasick"""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for segment in _ALL_PATHS_SEGMENTS:
+        automaton.add_word(segment, segment)
+    automaton.make_automaton()
+    return automaton
+
+# One pass over the request path instead of one substring scan per segment
+_ALL_PATHS_AUTOMATON = _build_path_segment_automaton()
+_GTM_ID_PREFIXES = tuple(SGTM_INDICATORS['gtm_id_prefixes'])
+_TRACKING_ID_PREFIXES = tuple(SGTM_INDICATORS['tracking_id_prefixes'])
+
+# Parameter score at which a server-side tracking request is classified as sGTM
+SGTM_SCORE_THRESHOLD = 3
+
+# Detected (host, path) -> platform entries kept by UnifiedPlatformDetector
+PLATFORM_CACHE_SIZE = 2048
+
+# Largest POST body (bytes) whose request hash is memoized
+REQUEST_HASH_CACHE_MAX_POST = 8192
+
+# Minimum seconds between two identical PARSE_ERROR log lines
+PARSE_ERROR_LOG_INTERVAL = 1.0
+
+# Distinct error messages tracked by the parse error rate limiter before expired ones are pruned
+PARSE_ERROR_LOG_KEYS_MAX = 256
+
+# Bounds on flattening a JSON body; anything beyond is dropped and flagged with "_truncated"
+JSON_FLATTEN_MAX_NODES = 10000
+JSON_FLATTEN_MAX_DEPTH = 16
 
 # Global state
 TARGET_DOMAIN: Optional[str] = os.environ.get('TARGET_DOMAIN')
 
+def _parse_target_host(target_domain: Optional[str]) -> str:
+    """Host part of the target domain URL, empty when unset or unparsable"""
+    if not target_domain:
+        return ""
+    try:
+        return urllib.parse.urlparse(target_domain).netloc
+    except ValueError:
+        return ""
+
+# TARGET_DOMAIN is fixed for the process lifetime, so its host is parsed once
+_TARGET_HOST = _parse_target_host(TARGET_DOMAIN)
+
+# Unix socket opened by start-logging.py - structured logs bypass the stdout pipe when it is set
+STRUCTURED_LOG_SOCKET: Optional[str] = os.environ.get('STRUCTURED_LOG_SOCKET')
+
 # platform_cache removed - now handled by platform_detector
 
 
@@ -59,31 +267,144 @@ class UnifiedLogger:
     
     def __init__(self):
         self.enable_debug = DEBUG_MODE
+        if not self.enable_debug:
+            # Debug calls become a no-op instead of checking the flag every time
+            self.log_debug = lambda message: None
+        
+        # Complete lines are coalesced in memory and handed to sys.stdout.buffer in one write per flush,
+        # so a line is never split or interleaved with other output on the same stream
+        self._stdout = sys.stdout.buffer
+        self._lines = bytearray()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = threading.Event()
+        self._structured_lines = bytearray()
+        self._structured_socket = self._open_structured_socket()
+        self._closed = False
+        self._flush_thread = threading.Thread(target=self._flush_loop, name="log-flush", daemon=True)
+        self._flush_thread.start()
+    
+    def _open_structured_socket(self) -> Optional[socket.socket]:
+        """Connect to the launcher's structured log socket, None to keep structured logs on stdout"""
+        if not STRUCTURED_LOG_SOCKET or not hasattr(socket, "AF_UNIX"):
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(STRUCTURED_LOG_SOCKET)
+        except OSError as e:
+            sock.close()
+            self.log_error(f"Structured log socket unavailable, using stdout: {e}")
+            return None
+        return sock
+    
+    def _write(self, line: bytes) -> None:
+        """Queue an output line for the next flush"""
+        with self._lock:
+            self._lines += line
+            buffer_full = len(self._lines) >= LOG_BUFFER_SIZE
+        if buffer_full:
+            self.flush()
+        else:
+            self._pending.set()
+    
+    def _write_structured(self, line: bytes) -> None:
+        """Queue a structured log line for the next flush"""
+        with self._lock:
+            if self._structured_socket is not None:
+                self._structured_lines += line
+                buffer_full = len(self._structured_lines) >= LOG_BUFFER_SIZE
+                line = None
+        if line is not None:
+            # No launcher socket (or it went away) - structured logs share stdout
+            self._write(line)
+        elif buffer_full:
+            self.flush()
+        else:
+            self._pending.set()
+    
+    def _flush_loop(self) -> None:
+        """Background flusher - one write syscall per interval instead of one per line"""
+        while not self._closed:
+            self._pending.wait()
+            if self._closed:
+                return
+            time.sleep(LOG_FLUSH_INTERVAL)
+            self._pending.clear()
+            try:
+                self.flush()
+            except (OSError, ValueError) as e:
+                # stdout is broken or closed - keep the flusher alive and report it where we still can
+                try:
+                    sys.stderr.write(f"ERROR: Log flush failed: {e}\n")
+                except (OSError, ValueError):
+                    pass
+    
+    def flush(self) -> None:
+        """Write out all buffered log lines"""
+        # Buffers are swapped out under _lock and written after releasing it, so logging never waits on I/O;
+        # _flush_lock only keeps concurrent flushes from reordering output
+        with self._flush_lock:
+            with self._lock:
+                lines, self._lines = self._lines, bytearray()
+                structured, self._structured_lines = self._structured_lines, bytearray()
+            if structured:
+                if self._structured_socket is None:
+                    # Queued just before the socket was dropped
+                    lines[:0] = structured
+                else:
+                    sent = 0
+                    try:
+                        with memoryview(structured) as view:
+                            while sent < len(view):
+                                sent += self._structured_socket.send(view[sent:])
+                    except OSError as e:
+                        # Launcher went away - re-send what it did not receive, and everything that follows, on stdout.
+                        # A line cut off mid-send is repeated whole so stdout never carries half a line.
+                        self._structured_socket.close()
+                        self._structured_socket = None
+                        lines[:0] = structured[structured.rfind(b"\n", 0, sent) + 1:]
+                        lines += f"ERROR: Structured log socket closed, using stdout: {e}\n".encode()
+            if lines:
+                self._stdout.write(lines)
+                self._stdout.flush()
+    
+    def close(self) -> None:
+        """Stop the flush thread, write out remaining lines and close the structured log socket"""
+        self._closed = True
+        self._pending.set()
+        self._flush_thread.join(timeout=1.0)
+        self.flush()
+        if self._structured_socket is not None:
+            self._structured_socket.close()
+            self._structured_socket = None
     
     def log_structured(self, log_type: str, event_name: str, data: Dict, metadata: Dict = None) -> None:
         """Output structured log entries for overlay consumption"""
         # Structured JSON for overlay (primary output)
         log_entry = {
-            "timestamp": time.time(),
+            "timestamp": _wall_clock(),
             "type": log_type,
             "event": event_name,
             "data": data,
             "metadata": metadata or {}
         }
-        print(f"[STRUCTURED] {json.dumps(log_entry, ensure_ascii=False, separators=(',', ':'))}", flush=True)
+        if orjson is not None:
+            # orjson emits compact UTF-8 bytes - no str round trip needed
+            self._write_structured(b"[STRUCTURED] " + orjson.dumps(log_entry, option=orjson.OPT_NON_STR_KEYS) + b"\n")
+        else:
+            self._write_structured(f"[STRUCTURED] {json.dumps(log_entry, ensure_ascii=False, separators=(',', ':'))}\n".encode())
     
     def log_debug(self, message: str) -> None:
         """Log debug message if debug mode is enabled"""
-        if self.enable_debug:
-            print(f"DEBUG: {message}", flush=True)
+        self._write(f"DEBUG: {message}\n".encode())
     
     def log_info(self, message: str) -> None:
         """Log informational message"""
-        print(message, flush=True)
+        self._write(f"{message}\n".encode())
     
     def log_error(self, message: str) -> None:
         """Log error message"""
-        print(f"ERROR: {message}", flush=True)
+        self._write(f"ERROR: {message}\n".encode())
 
 
 # Global logger instance
@@ -99,11 +420,59 @@ if TARGET_DOMAIN:
 unified_logger.log_info("-" * 50)
 
 
-def _generate_request_hash(url: str, post_data: str = "", method: str = "") -> str:
+def _compute_request_hash(url: str, post_data: bytes, method: str) -> str:
+    """Hash method, URL and POST body bytes into a short request fingerprint"""
+    # Combine method, URL and POST data for unique fingerprint (same bytes as encoding the decoded UTF-8 text)
+    content = f"{method}|{url}|".encode() + post_data
+    if xxhash is not None:
+        return xxhash.xxh3_64_hexdigest(content)[:12]  # Short hash (12 chars)
+    return hashlib.blake2b(content, digest_size=6).hexdigest()  # Short hash (12 chars), faster than md5
+
+# Every tracking request is hashed again when its response arrives
+_cached_request_hash = functools.lru_cache(maxsize=4096)(_compute_request_hash)
+
+def _generate_request_hash(url: str, post_data: bytes = b"", method: str = "") -> str:
     """Generate unique hash for request/response matching"""
-    # Combine method, URL and POST data for unique fingerprint
-    content = f"{method}|{url}|{post_data}"
-    return hashlib.md5(content.encode()).hexdigest()[:12]  # Short hash (12 chars)
+    if len(post_data) <= REQUEST_HASH_CACHE_MAX_POST:
+        return _cached_request_hash(url, post_data, method)
+    return _compute_request_hash(url, post_data, method)  # Large bodies would pin too much memory in the cache
+
+
+@functools.lru_cache(maxsize=2048)
+def _url_to_domain(url: str) -> str:
+    """Extract the host part of a page URL (cached - the same page URL repeats across events)"""
+    if "//" in url:
+        return url.split("//", 1)[-1].split("/", 1)[0]
+    return url.split("/", 1)[0]
+
+
+def _contains_tracking_segment(path: str) -> bool:
+    """Check if any tracking path segment occurs in the path"""
+    if _ALL_PATHS_AUTOMATON is not None:
+        return next(_ALL_PATHS_AUTOMATON.iter(path), None) is not None
+    for tracking_segment in _ALL_PATHS_SEGMENTS:
+        if tracking_segment in path:
+            return True
+    return False
+
+
+@functools.lru_cache(maxsize=256)
+def _cmp_provider_for_host(host: str) -> str:
+    """Detect which CMP provider serves a hostname (a page talks to only a handful of CMP hosts)"""
+    host = host.lower()
+    for key, provider in CMP_PROVIDERS.items():
+        if key in host:
+            return provider
+    
+    return "CMP"  # Generic fallback
+
+def _cmp_path_event(request_path: str) -> Optional[tuple]:
+    """(event suffix, event type) of the first _CMP_PATH_RULES group matching the path, None for API paths"""
+    for markers, group_event in _CMP_PATH_RULES:
+        for marker in markers:
+            if marker in request_path:
+                return group_event
+    return ("Activity", "Consent Management")
 
 
 # Unified Event Handler System
@@ -113,11 +482,13 @@ class BaseEventHandler:
     def __init__(self, platform_config):
         self.config = platform_config
         self.platform_name = platform_config.name
+        self.pixel_id_key = platform_config.pixel_id_key
+        self.event_name_key = platform_config.event_name_key
     
     def extract_identifiers(self, data: Dict[str, str]) -> tuple[str, str, str]:
         """Extract pixel_id, event_name, and event_type - can be overridden by subclasses"""
-        pixel_id = data.get(self.config.pixel_id_key, "")
-        event_name = data.get(self.config.event_name_key, "Unknown")
+        pixel_id = data.get(self.pixel_id_key, "")
+        event_name = data.get(self.event_name_key, "Unknown")
         event_type = "Standard Event"  # Default event type
         return pixel_id, event_name, event_type
     
@@ -144,23 +515,27 @@ class BaseEventHandler:
             extra_info.append(f"order: {order_id}")
         
         if page_url := mapped_data.get('page_url'):
-            domain = page_url.split("//")[-1].split("/")[0] if "//" in page_url else page_url
+            domain = _url_to_domain(page_url)
             extra_info.append(f"domain: {domain}")
         
         return extra_info
     
+    def extract_event(self, data: Dict[str, str], mapped_data: Dict[str, str]) -> tuple[str, str, str, List[str]]:
+        """Extract identifiers and platform info in one call - overridden where both share a classification"""
+        pixel_id, event_name, event_type = self.extract_identifiers(data)
+        return pixel_id, event_name, event_type, self.extract_platform_info(data, mapped_data, event_name)
+    
     def _extract_ga4_event_info(self, data: Dict[str, str]) -> List[str]:
         """Extract GA4-specific event information"""
         extra_info = []
+        get, append = data.get, extra_info.append
         
-        # Extract specific parameters
+        # Extract specific parameters - only long values pay for the gcs exemption check
         for param_key, display_name in EVENT_PARAMS:
-            if value := data.get(param_key):
-                if param_key == 'gcs':
-                    extra_info.append(f"{display_name}: {value}")
-                else:
-                    truncated = value[:50] + "..." if len(value) > 50 else value
-                    extra_info.append(f"{display_name}: {truncated}")
+            if value := get(param_key):
+                if len(value) > EVENT_PARAM_MAX_LENGTH and param_key != 'gcs':
+                    value = value[:EVENT_PARAM_MAX_LENGTH] + "..."
+                append(f"{display_name}: {value}")
         
         # Add product information if present
         products = parse_product_data(data)
@@ -187,42 +562,88 @@ class BaseEventHandler:
         return f"value: {value} {currency}".strip()
 
 
-class GA4EventHandler(BaseEventHandler):
-    """Specialized handler for GA4 events"""
+class _GTMLikeHandler(BaseEventHandler):
+    """Shared GA4/sGTM handling for gtag.js library loads, Consent Mode (CCM) and analytics hits"""
     
-    def extract_identifiers(self, data: Dict[str, str]) -> tuple[str, str, str]:
-        request_path = data.get("_request_path", "")
-        
-        # GTM Library Loading
+    # Overridden per platform
+    _gtag_event_name = "gtag_library_load"
+    _analytics_label = "Analytics Event"
+    
+    def _event_kind(self, request_path: str) -> str:
+        """Classify the hit by endpoint - drives both identifier and info extraction"""
         if "gtag/js" in request_path:
-            return data.get("id", ""), "gtag_library_load", "JavaScript Library"
-        
-        # Tag Diagnostics (TD)
-        if "/td" in request_path:
-            pixel_id = data.get("id", "")
-            event_name = "tag_diagnostics"
-            return pixel_id, event_name, "Tag Diagnostics"
-        
-        # Consent Mode (CCM)
+            return "gtag"    # GTM Library Loading
         if "ccm/collect" in request_path:
+            return "ccm"     # Consent Mode (CCM)
+        return "hit"         # Standard analytics event
+    
+    def _identifiers_for(self, kind: str, data: Dict[str, str]) -> tuple[str, str, str]:
+        if kind == "gtag":
+            return data.get("id", ""), self._gtag_event_name, "JavaScript Library"
+        if kind == "ccm":
             pixel_id = data.get("gtm") or f"CCM-{data.get('gcs', 'Unknown')}"
-            event_name = data.get("en", "consent_mode_event")
-            return pixel_id, event_name, "Consent Mode"
-        
-        # Standard GA4 event
-        pixel_id, event_name, _ = super().extract_identifiers(data)
-        return pixel_id, event_name, "Analytics Event"
+            return pixel_id, data.get("en", "consent_mode_event"), "Consent Mode"
+        pixel_id, event_name, _ = BaseEventHandler.extract_identifiers(self, data)
+        return pixel_id, event_name, self._analytics_label
+    
+    def _info_for(self, kind: str, data: Dict[str, str]) -> List[str]:
+        if kind == "gtag":
+            return self._gtag_library_info(data)
+        if kind == "ccm":
+            return self._consent_mode_info(data)
+        return self._extract_ga4_event_info(data)
+    
+    def extract_identifiers(self, data: Dict[str, str]) -> tuple[str, str, str]:
+        return self._identifiers_for(self._event_kind(data.get("_request_path", "")), data)
     
     def extract_platform_info(self, data: Dict[str, str], mapped_data: Dict[str, str], event_name: str = "") -> List[str]:
-        if event_name == "gtag_library_load":
-            extra_info = []
-            if gtm_id := data.get("gtm"): extra_info.append(f"GTM: {gtm_id}")
-            if container_id := data.get("cx"): extra_info.append(f"Container: {container_id}")
-            if experiments := data.get("tag_exp"):
-                exp_count = len(experiments.split('~')) if experiments else 0
-                extra_info.append(f"Experiments: {exp_count}")
-            return extra_info
-        elif event_name == "tag_diagnostics":
+        return self._info_for(self._event_kind(data.get("_request_path", "")), data)
+    
+    def extract_event(self, data: Dict[str, str], mapped_data: Dict[str, str]) -> tuple[str, str, str, List[str]]:
+        kind = self._event_kind(data.get("_request_path", ""))
+        return (*self._identifiers_for(kind, data), self._info_for(kind, data))
+    
+    def _gtag_library_info(self, data: Dict[str, str]) -> List[str]:
+        """Extract gtag.js library load information"""
+        extra_info = []
+        if gtm_id := data.get("gtm"): extra_info.append(f"GTM: {gtm_id}")
+        if container_id := data.get("cx"): extra_info.append(f"Container: {container_id}")
+        if experiments := data.get("tag_exp"):
+            exp_count = len(experiments.split('~')) if experiments else 0
+            extra_info.append(f"Experiments: {exp_count}")
+        return extra_info
+    
+    def _consent_mode_info(self, data: Dict[str, str]) -> List[str]:
+        """Extract Consent Mode (ccm/collect) information"""
+        extra_info = []
+        if gcs := data.get("gcs"): extra_info.append(f"GCS: {gcs}")
+        if gdpr := data.get("gdpr"): extra_info.append(f"GDPR: {'Yes' if gdpr == '1' else 'No'}")
+        if gdpr_consent := data.get("gdpr_consent"): extra_info.append(f"Consent: {self._truncate_value(gdpr_consent, 10)}")
+        if npa := data.get("npa"): extra_info.append(f"Non-Personalized: {'Yes' if npa == '1' else 'No'}")
+        if dma := data.get("dma"): extra_info.append(f"DMA: {dma}")
+        if dma_cps := data.get("dma_cps"): extra_info.append(f"DMA-CPS: {dma_cps}")
+        if page_url := data.get("dl"):
+            domain = _url_to_domain(page_url)
+            extra_info.append(f"Domain: {domain}")
+        return extra_info
+
+
+class GA4EventHandler(_GTMLikeHandler):
+    """Specialized handler for GA4 events"""
+    
+    def _event_kind(self, request_path: str) -> str:
+        # Tag Diagnostics (TD) - GTM library loads take precedence
+        if "/td" in request_path and "gtag/js" not in request_path:
+            return "td"
+        return super()._event_kind(request_path)
+    
+    def _identifiers_for(self, kind: str, data: Dict[str, str]) -> tuple[str, str, str]:
+        if kind == "td":
+            return data.get("id", ""), "tag_diagnostics", "Tag Diagnostics"
+        return super()._identifiers_for(kind, data)
+    
+    def _info_for(self, kind: str, data: Dict[str, str]) -> List[str]:
+        if kind == "td":
             extra_info = []
             if version := data.get("v"): extra_info.append(f"Version: {version}")
             if event_type := data.get("t"): extra_info.append(f"Type: {event_type}")
@@ -234,68 +655,17 @@ class GA4EventHandler(BaseEventHandler):
             if tdp := data.get("tdp"): extra_info.append(f"Tag Data: {self._truncate_value(tdp, 20)}")
             if mbc := data.get("mbc"): extra_info.append(f"MBC: {mbc}")
             if page_url := data.get("dl"):
-                domain = page_url.split("//")[-1].split("/")[0] if "//" in page_url else page_url
-                extra_info.append(f"Domain: {domain}")
-            return extra_info
-        elif "ccm/collect" in str(data.get("_request_path", "")):
-            extra_info = []
-            if gcs := data.get("gcs"): extra_info.append(f"GCS: {gcs}")
-            if gdpr := data.get("gdpr"): extra_info.append(f"GDPR: {'Yes' if gdpr == '1' else 'No'}")
-            if gdpr_consent := data.get("gdpr_consent"): extra_info.append(f"Consent: {self._truncate_value(gdpr_consent, 10)}")
-            if npa := data.get("npa"): extra_info.append(f"Non-Personalized: {'Yes' if npa == '1' else 'No'}")
-            if dma := data.get("dma"): extra_info.append(f"DMA: {dma}")
-            if dma_cps := data.get("dma_cps"): extra_info.append(f"DMA-CPS: {dma_cps}")
-            if page_url := data.get("dl"):
-                domain = page_url.split("//")[-1].split("/")[0] if "//" in page_url else page_url
+                domain = _url_to_domain(page_url)
                 extra_info.append(f"Domain: {domain}")
             return extra_info
-        else:
-            return self._extract_ga4_event_info(data)
+        return super()._info_for(kind, data)
 
 
-class ServerSideGTMEventHandler(BaseEventHandler):
+class ServerSideGTMEventHandler(_GTMLikeHandler):
     """Specialized handler for Server-side GTM events"""
     
-    def extract_identifiers(self, data: Dict[str, str]) -> tuple[str, str, str]:
-        request_path = data.get("_request_path", "")
-        
-        # GTM Library Loading
-        if "gtag/js" in request_path:
-            return data.get("id", ""), "gtag_library_load (sGTM)", "JavaScript Library"
-        
-        # Consent Mode (CCM)
-        if "ccm/collect" in request_path:
-            pixel_id = data.get("gtm") or f"CCM-{data.get('gcs', 'Unknown')}"
-            event_name = data.get("en", "consent_mode_event")
-            return pixel_id, event_name, "Consent Mode"
-        
-        # Standard sGTM event
-        pixel_id, event_name, _ = super().extract_identifiers(data)
-        return pixel_id, event_name, "Server-side Analytics"
-    
-    def extract_platform_info(self, data: Dict[str, str], mapped_data: Dict[str, str], event_name: str = "") -> List[str]:
-        if event_name == "gtag_library_load (sGTM)":
-            extra_info = []
-            if gtm_id := data.get("gtm"): extra_info.append(f"GTM: {gtm_id}")
-            if container_id := data.get("cx"): extra_info.append(f"Container: {container_id}")
-            if experiments := data.get("tag_exp"):
-                exp_count = len(experiments.split('~')) if experiments else 0
-                extra_info.append(f"Experiments: {exp_count}")
-            return extra_info
-        elif "ccm/collect" in str(data.get("_request_path", "")):
-            extra_info = []
-            if gcs := data.get("gcs"): extra_info.append(f"GCS: {gcs}")
-            if gdpr := data.get("gdpr"): extra_info.append(f"GDPR: {'Yes' if gdpr == '1' else 'No'}")
-            if gdpr_consent := data.get("gdpr_consent"): extra_info.append(f"Consent: {self._truncate_value(gdpr_consent, 10)}")
-            if npa := data.get("npa"): extra_info.append(f"Non-Personalized: {'Yes' if npa == '1' else 'No'}")
-            if dma := data.get("dma"): extra_info.append(f"DMA: {dma}")
-            if dma_cps := data.get("dma_cps"): extra_info.append(f"DMA-CPS: {dma_cps}")
-            if page_url := data.get("dl"):
-                domain = page_url.split("//")[-1].split("/")[0] if "//" in page_url else page_url
-                extra_info.append(f"Domain: {domain}")
-            return extra_info
-        else:
-            return self._extract_ga4_event_info(data)
+    _gtag_event_name = "gtag_library_load (sGTM)"
+    _analytics_label = "Server-side Analytics"
 
 
 class FacebookEventHandler(BaseEventHandler):
@@ -305,18 +675,7 @@ class FacebookEventHandler(BaseEventHandler):
         pixel_id, event_name, _ = super().extract_identifiers(data)
         
         # Determine event type based on event name
-        if event_name in ["PageView"]:
-            event_type = "Page Tracking"
-        elif event_name in ["Purchase", "InitiateCheckout", "AddToCart"]:
-            event_type = "E-commerce"
-        elif event_name in ["Lead", "CompleteRegistration", "Subscribe"]:
-            event_type = "Conversion"
-        elif event_name in ["ViewContent", "Search", "AddToWishlist"]:
-            event_type = "Engagement"
-        else:
-            event_type = "Custom Event"
-        
-        return pixel_id, event_name, event_type
+        return pixel_id, event_name, FB_EVENT_TYPES.get(event_name, "Custom Event")
     
     def extract_platform_info(self, data: Dict[str, str], mapped_data: Dict[str, str], event_name: str = "") -> List[str]:
         extra_info = []
@@ -325,15 +684,16 @@ class FacebookEventHandler(BaseEventHandler):
         if value := mapped_data.get('content_category'): extra_info.append(f"category: {value}")
         if value := mapped_data.get('value'): extra_info.append(self._format_value_currency(value, mapped_data.get('currency', '')))
         if value := mapped_data.get('content_ids'):
-            try:
-                if value.startswith('[') and value.endswith(']'):
-                    ids = json.loads(value)
-                    if isinstance(ids, list) and ids:
-                        extra_info.append(f"ids: {', '.join(str(id)[:10] for id in ids[:3])}")
-                else:
-                    extra_info.append(f"id: {value[:20]}")
-            except:
+            ids = None
+            if value[:1] == '[' and value[-1:] == ']':
+                try:
+                    ids = _json_loads(value)
+                except Exception:
+                    pass
+            if ids is None:
                 extra_info.append(f"id: {value[:20]}")
+            elif isinstance(ids, list) and ids:
+                extra_info.append(f"ids: {', '.join(str(id)[:10] for id in ids[:3])}")
         if value := mapped_data.get('num_items'): extra_info.append(f"items: {value}")
         
         return extra_info
@@ -343,8 +703,8 @@ class GoogleAdsEventHandler(BaseEventHandler):
     """Specialized handler for Google Ads events"""
     
     def extract_identifiers(self, data: Dict[str, str]) -> tuple[str, str, str]:
-        pixel_id = data.get(self.config.pixel_id_key, "")
-        request_path = str(data.get("_request_path", ""))
+        pixel_id = data.get(self.pixel_id_key, "")
+        request_path = data.get("_request_path", "")
         
         # Use utility function to extract AdWords ID
         if adwords_id := _extract_adwords_id(request_path):
@@ -397,7 +757,7 @@ class LinkedInEventHandler(BaseEventHandler):
     """Specialized handler for LinkedIn events with detailed path classification"""
     
     def extract_identifiers(self, data: Dict[str, str]) -> tuple[str, str, str]:
-        pixel_id = data.get(self.config.pixel_id_key, "")
+        pixel_id = data.get(self.pixel_id_key, "")
         request_path = data.get("_request_path", "")
         
         # Enhanced path-based classification based on LinkedIn API documentation
@@ -453,6 +813,10 @@ class LinkedInEventHandler(BaseEventHandler):
     
     def _classify_by_parameters(self, data: Dict[str, str]) -> tuple[str, str]:
         """Fallback classification based on parameters"""
+        # Most Insight Tag beacons carry none of the classifying params - one set intersection rules them all out
+        if not data.keys() & _LI_CLASSIFY_PARAMS:
+            return "Insight Tag", "General Tracking"
+        
         if data.get("conversionId"):
             return "Conversion Event", "Conversion Tracking"
         elif data.get("eventId"):
@@ -462,23 +826,11 @@ class LinkedInEventHandler(BaseEventHandler):
         elif data.get("v") and data.get("v") != "0":
             return "Value Event", "Value-based Tracking"
         elif url := data.get("url", "").lower():
-            # URL-based event classification
-            url_events = {
-                ("checkout", "purchase", "order"): ("Purchase Page", "E-commerce Tracking"),
-                ("cart", "basket"): ("Cart Page", "E-commerce Tracking"), 
-                ("contact", "form"): ("Lead Page", "Lead Generation"),
-                ("signup", "register"): ("Registration Page", "Registration Tracking"),
-                ("demo", "trial"): ("Demo Request", "Lead Generation"),
-                ("download"): ("Download Page", "Content Engagement")
-            }
-            
-            for keywords, (event_name, event_type) in url_events.items():
-                if isinstance(keywords, tuple):
-                    if any(keyword in url for keyword in keywords):
-                        return event_name, event_type
-                else:
-                    if keywords in url:
-                        return event_name, event_type
+            # URL-based event classification - first matching keyword group wins
+            for keywords, event in _LI_URL_EVENTS:
+                for keyword in keywords:
+                    if keyword in url:
+                        return event
             
             return "Page View", "Page Tracking"
         else:
@@ -527,7 +879,7 @@ class LinkedInEventHandler(BaseEventHandler):
             extra_info.append(f"order: {order_id}")
         
         if page_url := mapped_data.get('page_url'):
-            domain = page_url.split("//")[-1].split("/")[0] if "//" in page_url else page_url.split("/")[0]
+            domain = _url_to_domain(page_url)
             extra_info.append(f"domain: {domain}")
         
         # LinkedIn-specific IDs
@@ -547,7 +899,7 @@ class PinterestEventHandler(BaseEventHandler):
     """Specialized handler for Pinterest events"""
     
     def extract_identifiers(self, data: Dict[str, str]) -> tuple[str, str, str]:
-        pixel_id = data.get(self.config.pixel_id_key, "")
+        pixel_id = data.get(self.pixel_id_key, "")
         dep_value = data.get("dep", "").upper()
         
         pinterest_events = {
@@ -560,7 +912,7 @@ class PinterestEventHandler(BaseEventHandler):
             if keyword in dep_value:
                 return pixel_id, event_name, event_type
         
-        event_name = data.get(self.config.event_name_key, "Unknown")
+        event_name = data.get(self.event_name_key, "Unknown")
         return pixel_id, event_name, "Pinterest Event"
 
 
@@ -569,42 +921,48 @@ class DoubleClickEventHandler(BaseEventHandler):
     
     def extract_identifiers(self, data: Dict[str, str]) -> tuple[str, str, str]:
         request_path = data.get("_request_path", "")
-        request_url = data.get("_request_url", "")
-        
-        # DDM Activity/Floodlight tracking (both formats)
-        if "/ddm/activity/" in request_path:
-            pixel_id, event_name = self._extract_ddm_activity_info(request_path, data)
-            event_name = "Floodlight Activity"
-            return pixel_id, event_name, "Floodlight Activity"
-        elif "activity" in request_path:
-            pixel_id, event_name = self._extract_activity_semicolon_params(request_url, data)
-            event_name = "Floodlight Activity"
-            return pixel_id, event_name, "Floodlight Activity"
-        elif "google_com" in request_path:
-            return "", "Cookie Matching", "Cookie Matching"
-        
-        # View-through conversion tracking
-        elif "/pagead/viewthroughconversion/" in request_path:
-            if match := re.search(r'/pagead/viewthroughconversion/(\d+)/', request_path):
-                pixel_id = match.group(1)
-                event_name = "View-Through Conversion"
-                if cv := data.get("cv"):
-                    event_name += f" (${cv})"
-                return pixel_id, event_name, "View-Through Conversion"
-            return "", "View-Through Conversion", "View-Through Conversion"
-        
-        # GA4 Enhanced Conversions
-        elif "/g/collect" in request_path:
-            pixel_id = data.get("tid", "")
-            event_type = data.get("t", "")
-            event_name = "GA Signals" if event_type == "dc" else f"GA4 {event_type}" if event_type else "GA4 Event"
-            return pixel_id, event_name, "Enhanced Conversion"
+        
+        # First marker found, in table order, picks the endpoint branch
+        for marker, handler in self._PATH_HANDLERS.items():
+            if marker in request_path:
+                return handler(self, data, request_path)
         
         # Standard DoubleClick tracking
-        else:
-            pixel_id = data.get("tid", data.get("label", ""))
-            event_name = data.get("t", data.get("label", "DoubleClick Evenxxxt"))
-            return pixel_id, event_name, "Display Tracking"
+        pixel_id = data.get("tid", data.get("label", ""))
+        event_name = data.get("t", data.get("label", "DoubleClick Evenxxxt"))
+        return pixel_id, event_name, "Display Tracking"
+    
+    def _ddm_activity_identifiers(self, data: Dict[str, str], request_path: str) -> tuple[str, str, str]:
+        """DDM Activity/Floodlight tracking (path format)"""
+        pixel_id, _ = self._extract_ddm_activity_info(request_path, data)
+        return pixel_id, "Floodlight Activity", "Floodlight Activity"
+    
+    def _activity_identifiers(self, data: Dict[str, str], request_path: str) -> tuple[str, str, str]:
+        """Floodlight tracking (semicolon parameter format)"""
+        pixel_id, _ = self._extract_activity_semicolon_params(data.get("_request_url", ""), data)
+        return pixel_id, "Floodlight Activity", "Floodlight Activity"
+    
+    def _cookie_matching_identifiers(self, data: Dict[str, str], request_path: str) -> tuple[str, str, str]:
+        """Cookie matching"""
+        return "", "Cookie Matching", "Cookie Matching"
+    
+    def _view_through_identifiers(self, data: Dict[str, str], request_path: str) -> tuple[str, str, str]:
+        """View-through conversion tracking"""
+        # Conversion ID is the digit segment right after the marker, e.g. /pagead/viewthroughconversion/123/
+        pixel_id, sep, _ = request_path.partition("/pagead/viewthroughconversion/")[2].partition("/")
+        if sep and pixel_id.isdigit():
+            event_name = "View-Through Conversion"
+            if cv := data.get("cv"):
+                event_name += f" (${cv})"
+            return pixel_id, event_name, "View-Through Conversion"
+        return "", "View-Through Conversion", "View-Through Conversion"
+    
+    def _ga4_collect_identifiers(self, data: Dict[str, str], request_path: str) -> tuple[str, str, str]:
+        """GA4 Enhanced Conversions"""
+        pixel_id = data.get("tid", "")
+        event_type = data.get("t", "")
+        event_name = "GA Signals" if event_type == "dc" else f"GA4 {event_type}" if event_type else "GA4 Event"
+        return pixel_id, event_name, "Enhanced Conversion"
     
     def _extract_activity_semicolon_params(self, request_url: str, data: Dict[str, str]) -> tuple[str, str]:
         """Extract parameters from /activity;param1=value1;param2=value2;... format"""
@@ -614,38 +972,7 @@ class DoubleClickEventHandler(BaseEventHandler):
             
             if path_part.startswith('activity;'):
                 # Remove 'activity;' prefix and parse parameters
-                param_string = path_part[9:]  # Remove 'activity;'
-                
-                # Parse semicolon-separated parameters
-                params = {}
-                for param in param_string.split(';'):
-                    if '=' in param:
-                        key, value = param.split('=', 1)
-                        import urllib.parse
-                        value = urllib.parse.unquote(value)
-                        params[key] = value
-                
-                # Extract key identifiers
-                src_id = params.get('src', '')  # Advertiser/source ID
-                activity_type = params.get('type', '')  # Activity type
-                category = params.get('cat', '')  # Activity category
-                ord_id = params.get('ord', '')  # Order ID
-                
-                # Create meaningful pixel ID and event name
-                pixel_id = src_id if src_id else "Unknown"
-                
-                if activity_type and category:
-                    event_name = f"Floodlight_{activity_type}_{category}"
-                elif activity_type:
-                    event_name = f"Floodlight_{activity_type}"
-                else:
-                    event_name = "Floodlight_Activity"
-                
-                # Add order info if present and not default
-                if ord_id and ord_id != '1':
-                    event_name += f"_ord{ord_id}"
-                
-                return pixel_id, event_name
+                return self._build_floodlight_name(path_part[9:])
         
         # Fallback if parsing fails
         return "Unknown", "Floodlight_Activity"
@@ -654,16 +981,16 @@ class DoubleClickEventHandler(BaseEventHandler):
         """Extract DDM Activity/Floodlight information from path parameters"""
         # Extract activity parameters from path like: /ddm/activity/gdpr=0;src=10802082;type=invmedia;cat=de-gr0;...
         activity_part = request_path.split('/ddm/activity/')[-1].split('?')[0]
-        
-        # Parse semicolon-separated parameters
+        return self._build_floodlight_name(activity_part)
+    
+    def _build_floodlight_name(self, param_string: str) -> tuple[str, str]:
+        """Build pixel ID and event name from semicolon-separated Floodlight parameters"""
+        # Parse semicolon-separated parameters - only percent-encoded values pay for unquote
         params = {}
-        for param in activity_part.split(';'):
-            if '=' in param:
-                key, value = param.split('=', 1)
-                # Decode URL encoding and template variables
-                import urllib.parse
-                value = urllib.parse.unquote(value)
-                params[key] = value
+        for param in param_string.split(';'):
+            key, sep, value = param.partition('=')
+            if sep:
+                params[key] = urllib.parse.unquote(value) if '%' in value else value
         
         # Extract key identifiers
         src_id = params.get('src', '')  # Advertiser/source ID
@@ -681,26 +1008,36 @@ class DoubleClickEventHandler(BaseEventHandler):
         else:
             event_name = "Floodlight_Activity"
         
-        # Add order info if present
+        # Add order info if present and not default
         if ord_id and ord_id != '1':
             event_name += f"_ord{ord_id}"
         
         return pixel_id, event_name
+    
+    # Path marker -> branch, checked in order - /ddm/activity/ must precede its "activity" substring
+    _PATH_HANDLERS = {
+        "/ddm/activity/": _ddm_activity_identifiers,
+        "activity": _activity_identifiers,
+        "google_com": _cookie_matching_identifiers,
+        "/pagead/viewthroughconversion/": _view_through_identifiers,
+        "/g/collect": _ga4_collect_identifiers
+    }
 
 
 class MicrosoftBingEventHandler(BaseEventHandler):
     """Specialized handler for Microsoft/Bing UET events"""
     def extract_identifiers(self, data: Dict[str, str]) -> tuple[str, str, str]:
         request_path = data.get("_request_path", "")
-        pixel_id = data.get(self.config.pixel_id_key, "")
-        event_name = data.get(self.config.event_name_key, "")
+        pixel_id = data.get(self.pixel_id_key, "")
+        event_name = data.get(self.event_name_key, "")
         event_type = "UET Tracking"
 
         # Path-based classification
-        if "/p/insights/t/" in request_path:
-            match = re.search(r'/p/insights/t/(\d+)', request_path)
-            if match:
-                pixel_id = match.group(1)
+        _, insights, tag_path = request_path.partition("/p/insights/t/")
+        if insights:
+            # Tag ID is the run of digits right after the prefix
+            if tag_id := tag_path[:len(tag_path) - len(tag_path.lstrip("0123456789"))]:
+                pixel_id = tag_id
             event_name = "UET_Insights"
             event_type = "Analytics Insights"
 
@@ -742,7 +1079,7 @@ class MicrosoftBingEventHandler(BaseEventHandler):
         
         # Page URL
         if page_url := mapped_data.get('page_url'):
-            domain = page_url.split("//")[-1].split("/")[0] if "//" in page_url else page_url
+            domain = _url_to_domain(page_url)
             extra_info.append(f"domain: {domain}")
         
         return extra_info
@@ -752,36 +1089,25 @@ class PrivacySandboxEventHandler(BaseEventHandler):
     """Specialized handler for Privacy Sandbox events"""
     
     def extract_identifiers(self, data: Dict[str, str]) -> tuple[str, str, str]:
-        pixel_id = data.get(self.config.pixel_id_key, "")
+        pixel_id = data.get(self.pixel_id_key, "")
         request_path = data.get("_request_path", "")
         host = data.get("_request_host", "")
         
         # Determine platform from request host
         if "facebook.com" in host:
             platform_name = "Facebook"
-        elif any(pattern in host for pattern in ["google.com", "doubleclick.net", "googlesyndication.com","region1.google-analytics.com"]):
+        elif any(pattern in host for pattern in _SANDBOX_GOOGLE_HOSTS):
             platform_name = "Google"
         else:
             platform_name = "Privacy Sandbox"
         
-        # Sandbox event mapping
-        sandbox_events = {
-            "/privacy_sandbox/topics/registration": "Topics Registration",
-            "/privacy_sandbox/pixel/register/trigger": "Pixel Registration", 
-            "/privacy_sandbox/topics/": "Topics API",
-            "/privacy_sandbox/fledge/": "FLEDGE",
-            "/privacy_sandbox/attribution_reporting/": "Attribution Reporting",
-            "/privacy_sandbox/trust_tokens/": "Trust Tokens",
-            "/privacy_sandbox/private_aggregation/": "Private Aggregation",
-            "/privacy_sandbox/shared_storage/": "Shared Storage",
-            "/privacy_sandbox/": "Privacy Sandbox"
-        }
-        
+        # Every sandbox endpoint shares the /privacy_sandbox/ prefix - skip the table when it is absent
         event_type_name = "Privacy Sandbox Event"
-        for path_pattern, sandbox_event_name in sandbox_events.items():
-            if path_pattern in request_path:
-                event_type_name = sandbox_event_name
-                break
+        if "/privacy_sandbox/" in request_path:
+            for path_pattern, sandbox_event_name in SANDBOX_EVENTS.items():
+                if path_pattern in request_path:
+                    event_type_name = sandbox_event_name
+                    break
         
         if data.get("ev") == "PageView":
             return pixel_id, f"{platform_name} PageView", "Privacy-Enhanced Tracking"
@@ -796,43 +1122,28 @@ class CCMEventHandler(BaseEventHandler):
     """Specialized handler for Google Consent Collection Module (CCM) events"""
     
     def extract_identifiers(self, data: Dict[str, str]) -> tuple[str, str, str]:
-        pixel_id = data.get(self.config.pixel_id_key, "")
-        request_path = data.get("_request_path", "")
-        
-        # Check for consent-related parameters to determine event type
-        consent_state = data.get("gcs", "")
-        gdpr_applies = data.get("gdpr", "")
-        dma_state = data.get("dma", "")
-        
-        # Determine event type based on consent parameters
-        if consent_state:
-            if "G1" in consent_state:
-                event_name = "Consent Granted"
-                event_type = "Consent Update"
-            elif "G0" in consent_state:
-                event_name = "Consent Denied"
-                event_type = "Consent Update"
-            else:
-                event_name = "Consent State Change"
-                event_type = "Consent Update"
-        elif gdpr_applies:
-            event_name = "GDPR Compliance Check"
-            event_type = "Privacy Compliance"
-        elif dma_state:
-            event_name = "DMA Consent Processing"
-            event_type = "Privacy Compliance"
-        else:
-            event_name = "Consent Collection"
-            event_type = "Privacy Data Collection"
+        pixel_id = data.get(self.pixel_id_key, "")
+        
+        # Consent state (gcs) wins; G1/G0 markers refine it into granted/denied
+        if consent_state := data.get("gcs", ""):
+            for marker, (event_name, event_type) in _CCM_CONSENT_EVENTS:
+                if marker in consent_state:
+                    return pixel_id, event_name, event_type
+            return pixel_id, "Consent State Change", "Consent Update"
+        
+        # Otherwise the first privacy signal present determines the event
+        for param, (event_name, event_type) in _CCM_SIGNAL_EVENTS:
+            if data.get(param, ""):
+                return pixel_id, event_name, event_type
         
-        return pixel_id, event_name, event_type
+        return pixel_id, "Consent Collection", "Privacy Data Collection"
 
 
 class TaboolaEventHandler(BaseEventHandler):
     """Specialized handler for Taboola events with flexible path detection"""
     
     def extract_identifiers(self, data: Dict[str, str]) -> tuple[str, str, str]:
-        pixel_id = data.get(self.config.pixel_id_key, "")
+        pixel_id = data.get(self.pixel_id_key, "")
         request_path = data.get("_request_path", "")
         
         # Extract publisher ID from path if present (e.g., /1532474/trc/3/json)
@@ -868,15 +1179,13 @@ class TaboolaEventHandler(BaseEventHandler):
         # Extract data from the JSON payload if present
         if tracking_data := data.get('data'):
             try:
-                import json
-                import urllib.parse
                 decoded_data = urllib.parse.unquote(tracking_data)
                 json_data = json.loads(decoded_data)
                 
                 # Extract key information from the JSON payload
                 if 'u' in json_data:
                     page_url = json_data['u']
-                    domain = page_url.split("//")[-1].split("/")[0] if "//" in page_url else page_url
+                    domain = _url_to_domain(page_url)
                     extra_info.append(f"domain: {domain}")
                 
                 if 'cv' in json_data:
@@ -901,7 +1210,7 @@ class TaboolaEventHandler(BaseEventHandler):
             extra_info.append(f"value: {value} {currency}".strip())
         
         if page_url := mapped_data.get('page_url'):
-            domain = page_url.split("//")[-1].split("/")[0] if "//" in page_url else page_url
+            domain = _url_to_domain(page_url)
             extra_info.append(f"domain: {domain}")
         
         return extra_info
@@ -911,63 +1220,30 @@ class ConsentManagementPlatformEventHandler(BaseEventHandler):
     """Generic handler for all Consent Management Platform events (OneTrust, Usercentrics, Cookiebot, etc.)"""
     
     def extract_identifiers(self, data: Dict[str, str]) -> tuple[str, str, str]:
-        pixel_id = data.get(self.config.pixel_id_key, "")
+        pixel_id = data.get(self.pixel_id_key, "")
         request_path = data.get("_request_path", "")
         request_host = data.get("_request_host", "")
         
         # Detect CMP provider from host
         cmp_provider = self._detect_cmp_provider(request_host)
         
-        # Determine event type based on URL path and parameters
-        if any(path in request_path for path in ["/browser-ui/", "/otnotice/", "/cc.js", "/cs.js", "/uc.js"]):
-            event_name = f"{cmp_provider} Banner Load"
-            event_type = "Banner Display"
-        elif any(path in request_path for path in ["/api/", "/consent/", "/groups/", "/choice.js"]):
-            if "consent" in request_path.lower():
-                event_name = f"{cmp_provider} Consent API"
-                event_type = "Consent Processing"
-            elif "settings" in request_path.lower() or "groups" in request_path.lower():
-                event_name = f"{cmp_provider} Settings Load"
-                event_type = "Configuration"
+        # Determine event type based on URL path - first matching marker group wins
+        event = _cmp_path_event(request_path)
+        if event is None:
+            lower_path = request_path.lower()
+            if "consent" in lower_path:
+                event = ("Consent API", "Consent Processing")
+            elif "settings" in lower_path or "groups" in lower_path:
+                event = ("Settings Load", "Configuration")
             else:
-                event_name = f"{cmp_provider} API Request"
-                event_type = "API Communication"
-        elif any(path in request_path for path in ["/settings/", "/latest/", "/scripttemplates/"]):
-            event_name = f"{cmp_provider} Configuration"
-            event_type = "Settings"
-        elif any(path in request_path for path in ["/privacy-notice/", "/cookie-policy/"]):
-            event_name = f"{cmp_provider} Policy Load"
-            event_type = "Policy Display"
-        else:
-            event_name = f"{cmp_provider} Activity"
-            event_type = "Consent Management"
+                event = ("API Request", "API Communication")
         
-        return pixel_id, event_name, event_type
+        event_suffix, event_type = event
+        return pixel_id, f"{cmp_provider} {event_suffix}", event_type
     
     def _detect_cmp_provider(self, host: str) -> str:
         """Detect which CMP provider based on hostname"""
-        cmp_mapping = {
-            "usercentrics": "Usercentrics",
-            "cookielaw.org": "OneTrust", 
-            "onetrust.com": "OneTrust",
-            "optanon": "OneTrust",
-            "cookiebot.com": "Cookiebot",
-            "consentmanager": "ConsentManager",
-            "consensu.org": "ConsentManager", 
-            "iubenda.com": "Iubenda",
-            "cookie-script.com": "CookieScript",
-            "cdn.cookie-script.com": "CookieScript",
-            "consent.cookie-script.com": "CookieScript",
-            "quantcast.com": "Quantcast",
-            "trustarc.com": "TrustArc",
-            "didomi": "Didomi"
-        }
-        
-        for key, provider in cmp_mapping.items():
-            if key in host.lower():
-                return provider
-        
-        return "CMP"  # Generic fallback
+        return _cmp_provider_for_host(host)
     
     def extract_platform_info(self, data: Dict[str, str], mapped_data: Dict[str, str], event_name: str = "") -> List[str]:
         extra_info = []
@@ -996,7 +1272,6 @@ class ConsentManagementPlatformEventHandler(BaseEventHandler):
         if services := mapped_data.get('services'):
             try:
                 if services.startswith('[') and services.endswith(']'):
-                    import json
                     services_list = json.loads(services)
                     extra_info.append(f"services: {len(services_list)}")
                 else:
@@ -1052,12 +1327,12 @@ class MicrosoftClarityEventHandler(BaseEventHandler):
         
         # Add URL if available
         if url := data.get("url"):
-            domain = url.split("//")[-1].split("/")[0] if "//" in url else url
+            domain = _url_to_domain(url)
             extra_info.append(f"domain: {domain}")
         
         # Add referrer if available
         if referrer := data.get("referrer"):
-            ref_domain = referrer.split("//")[-1].split("/")[0] if "//" in referrer else referrer
+            ref_domain = _url_to_domain(referrer)
             extra_info.append(f"referrer: {ref_domain}")
         
         return extra_info
@@ -1082,8 +1357,9 @@ EVENT_HANDLERS = {
 }
 
 
+@functools.lru_cache(maxsize=64)
 def get_event_handler(platform: str) -> BaseEventHandler:
-    """Get appropriate event handler for platform"""
+    """Get appropriate event handler for platform (handlers are stateless, so one instance per platform is shared)"""
     if platform not in PLATFORMS:
         return BaseEventHandler(type('DefaultConfig', (), {
             'name': platform,
@@ -1107,18 +1383,17 @@ def extract_platform_specific_info(data: Dict[str, str], platform: str, mapped_d
 def parse_product_data(data: Dict[str, str]) -> List[Dict[str, str]]:
     """Parse Enhanced Ecommerce product data efficiently"""
     products = []
-    product_params = {k: v for k, v in data.items() if k.startswith('pr') and k[2:].isdigit()}
     
-    for prod_value in product_params.values():
+    for param, prod_value in data.items():
+        if not (param.startswith('pr') and param[2:].isdigit()):
+            continue
         try:
-            decoded = urllib.parse.unquote(prod_value)
+            decoded = urllib.parse.unquote(prod_value) if '%' in prod_value else prod_value
             product_info = {}
             
             for part in decoded.split('~'):
-                if len(part) > 2:
-                    prefix, value = part[:2], part[2:]
-                    if prefix in {'nm': 'name', 'id': 'id', 'pr': 'price', 'br': 'brand', 'ca': 'category', 'qt': 'quantity'}:
-                        product_info[{'nm': 'name', 'id': 'id', 'pr': 'price', 'br': 'brand', 'ca': 'category', 'qt': 'quantity'}[prefix]] = value
+                if len(part) > 2 and (key := _PRODUCT_PREFIX_MAP.get(part[:2])) is not None:
+                    product_info[key] = part[2:]
             
             if product_info:
                 products.append(product_info)
@@ -1132,15 +1407,16 @@ def process_json_event(json_data: Dict, event: Dict, url_params: Dict[str, str])
     event_data = url_params.copy()
     
     # Get GA4 parameter mapping for JSON processing
-    ga4_param_map = PLATFORMS["GA4"].param_map
+    mapped_key = _GA4_PARAM_MAP.get
     
-    # Add common fields
-    for json_key, ga_key in ga4_param_map.items():
-        if json_key in json_data:
-            if json_key == 'non_personalized_ads':
-                event_data['npa'] = '1' if json_data[json_key] else '0'
-            else:
-                event_data[ga_key] = str(json_data[json_key])
+    # Add common fields - JSON payloads carry far fewer keys than the param map
+    for json_key, value in json_data.items():
+        if (ga_key := mapped_key(json_key)) is None:
+            continue
+        if json_key == 'non_personalized_ads':
+            event_data['npa'] = '1' if value else '0'
+        else:
+            event_data[ga_key] = str(value)
     
     # Add event data
     if 'name' in event:
@@ -1148,8 +1424,8 @@ def process_json_event(json_data: Dict, event: Dict, url_params: Dict[str, str])
     
     if 'params' in event:
         for param_key, param_value in event['params'].items():
-            if param_key in ga4_param_map:
-                event_data[ga4_param_map[param_key]] = str(param_value)
+            if (ga_key := mapped_key(param_key)) is not None:
+                event_data[ga_key] = str(param_value)
             else:
                 prefix = f'ep.{param_key}'
                 if isinstance(param_value, list):
@@ -1163,65 +1439,51 @@ def process_json_event(json_data: Dict, event: Dict, url_params: Dict[str, str])
 class UnifiedPlatformDetector:
     """Unified platform detection system"""
     
+    __slots__ = ("platform_cache",)
+    
     def __init__(self):
-        self.platform_cache = {}
+        self.platform_cache: Dict[tuple, str] = collections.OrderedDict()
     
     def detect_platform(self, host: str, path: str, flow: http.HTTPFlow = None) -> str:
         """Detect marketing platform from hostname AND path with unified logic"""
-        cache_key = f"{host}:{path}"
-        
-        # Check cache first
-        if cache_key in self.platform_cache:
-            return self.platform_cache[cache_key]
-        
+        cache_key = (host, path)
+        cache = self.platform_cache
+        
+        # Check cache first - least recently used entries are evicted once it is full
+        if (platform := cache.get(cache_key)) is not None:
+            cache.move_to_end(cache_key)
+            return platform
+        
+        platform = self._detect_uncached(host, path, flow)
+        cache[cache_key] = platform
+        if len(cache) > PLATFORM_CACHE_SIZE:
+            cache.popitem(last=False)
+        return platform
+    
+    def _detect_uncached(self, host: str, path: str, flow: http.HTTPFlow = None) -> str:
+        """Run the detection rules in priority order"""
         # HIGHEST PRIORITY: Privacy Sandbox detection by path (regardless of host)
         if "/privacy-sandbox" in path or "/privacy_sandbox" in path:
-            self.platform_cache[cache_key] = "Privacy Sandbox"
             return "Privacy Sandbox"
         
         # HIGH PRIORITY: Google Consent Collection Module detection
         if path == "/ccm/collect" and host in ["www.google.com", "google.com", "www.googletagmanager.com", "googletagmanager.com"]:
-            self.platform_cache[cache_key] = "Google Consent Collection"
             return "Google Consent Collection"
         
         # HIGH PRIORITY: Regional Google Analytics detection (pattern-based)
         if self._is_regional_ga4(host, path):
-            self.platform_cache[cache_key] = "GA4"
             return "GA4"
         
         # Server-side GTM detection (integrated)
-        if flow:
-            sgtm_result = self._check_server_side_tracking(host, path, flow)
-            if sgtm_result == "sGTM":
-                self.platform_cache[cache_key] = "sGTM"
-                return "sGTM"
+        if flow and self._check_server_side_tracking(host, path, flow) == "sGTM":
+            return "sGTM"
         
         # Standard platform detection with path matching
-        platform = self._detect_standard_platform(host, path)
-        self.platform_cache[cache_key] = platform
-        return platform
+        return self._detect_standard_platform(host, path)
     
     def _is_regional_ga4(self, host: str, path: str) -> bool:
         """Check if this is a regional Google Analytics domain"""
-        import re
-        
-        # GA4 paths that should be detected
-        ga4_paths = ["/g/collect", "/g/s/collect", "/collect", "/r/collect", "/gtag/js", "/mp/collect", "/td"]
-        
-        # Check if path matches GA4 patterns
-        if not any(path.startswith(ga4_path) for ga4_path in ga4_paths):
-            return False
-        
-        # Regional Google Analytics patterns
-        regional_patterns = [
-            r"^region\d+\.analytics\.google\.com$",         # region1.analytics.google.com, region2.analytics.google.com, etc.
-            r"^region\d+\.google-analytics\.com$",          # region1.google-analytics.com, region2.google-analytics.com, etc.
-            r"^[a-z]{2,5}\d*\.analytics\.google\.com$",     # us1.analytics.google.com, eu2.analytics.google.com, asia1.analytics.google.com, etc.
-            r"^[a-z]{2,5}\d*\.google-analytics\.com$",      # us1.google-analytics.com, eu2.google-analytics.com, asia1.google-analytics.com, etc.
-        ]
-        
-        # Check if host matches any regional pattern
-        return any(re.match(pattern, host) for pattern in regional_patterns)
+        return path.startswith(_REGIONAL_GA4_PATHS) and _REGIONAL_GA4_HOST_RE.match(host) is not None
     
     def _detect_standard_platform(self, host: str, path: str) -> str:
         """Detect standard platforms using configuration"""
@@ -1233,33 +1495,28 @@ class UnifiedPlatformDetector:
         if path == "/gtm.js" or path.startswith("/gtm.js?"):
             return "GA4"  # GTM is part of GA4 ecosystem
         
-        # First pass: Find platforms that match both host AND path (highest priority)
-        for platform_name, config in PLATFORMS.items():
-            if host in config.hosts:
-                # Check if path matches any of the platform's paths
-                if any(path.startswith(platform_path) for platform_path in config.paths):
-                    return platform_name
+        # Only platforms serving this host are candidates
+        candidates = _PLATFORMS_BY_HOST.get(host)
+        if not candidates:
+            # Return "Custom Tracking" instead of "Unknown" for proper response handling
+            return "Custom Tracking"
         
-        # Second pass: Fallback to host-only detection for platforms without specific path requirements
-        for platform_name, config in PLATFORMS.items():
-            if host in config.hosts:
+        # Platforms that match both host AND path take priority
+        for platform_name, platform_paths in candidates:
+            if path.startswith(platform_paths):
                 return platform_name
         
-        # Return "Custom Tracking" instead of "Unknown" for proper response handling
-        return "Custom Tracking"
+        # Fallback to host-only detection for platforms without specific path requirements
+        return candidates[0][0]
     
     def _check_server_side_tracking(self, host: str, path: str, flow: http.HTTPFlow) -> str:
         """Check server-side tracking and return platform name or None"""
-        # Skip if already known platform hosts - prevent misclassification
-        known_platform_hosts = set()
-        for platform_config in PLATFORMS.values():
-            known_platform_hosts.update(platform_config.hosts)
-        
         # Special handling for Taboola - exclude from server-side detection
         if host == "trc.taboola.com" and "/trc/" in path:
             return None
         
-        if host in known_platform_hosts:
+        # Skip if already known platform hosts - prevent misclassification
+        if host in ALL_HOSTS:
             return None
         
         # Use consolidated parameter extraction
@@ -1282,7 +1539,7 @@ class UnifiedPlatformDetector:
         if hasattr(flow, "_all_params_dict"):
             return flow._all_params_dict
         
-        params = dict(flow.request.query)
+        params = _query_to_dict(flow.request.query)
         if flow.request.method == "POST" and flow.request.content:
             content_type = flow.request.headers.get("content-type", "").lower()
             try:
@@ -1292,8 +1549,7 @@ class UnifiedPlatformDetector:
                     if isinstance(json_data, dict):
                         params.update(json_data)
                 elif "application/x-www-form-urlencoded" in content_type:
-                    post_params = urllib.parse.parse_qs(post_text)
-                    params.update({k: v[0] for k, v in post_params.items() if v})
+                    params.update(_parse_form_params(post_text))
             except (json.JSONDecodeError, UnicodeDecodeError):
                 pass
         flow._all_params_dict = params
@@ -1327,30 +1583,19 @@ class UnifiedPlatformDetector:
         if self._count_matching_params(params, SGTM_INDICATORS['ecommerceParams']) >= 2:
             return True
         
-        # Check platform-specific key parameters from config
-        platform_key_params = self._get_platform_key_params()
-        if self._count_matching_params(params, platform_key_params) >= 2:
+        # Check platform-specific key parameters from config (a key shared by several platforms counts once per platform)
+        if sum(_PLATFORM_KEY_PARAM_COUNTS[key] for key in params.keys() & _PLATFORM_KEY_PARAM_COUNTS.keys()) >= 2:
             return True
         
         return False
     
-    def _count_matching_params(self, params: Dict[str, str], indicators: List[str]) -> int:
+    def _count_matching_params(self, params: Dict[str, str], indicators: FrozenSet[str]) -> int:
         """Count how many indicator parameters are present"""
-        return sum(1 for p in indicators if p in params)
+        return len(params.keys() & indicators)
     
-    def _has_any_params(self, params: Dict[str, str], indicators: List[str]) -> bool:
+    def _has_any_params(self, params: Dict[str, str], indicators: FrozenSet[str]) -> bool:
         """Check if any indicator parameters are present"""
-        return any(p in params for p in indicators)
-    
-    def _get_platform_key_params(self) -> List[str]:
-        """Get all platform-specific key parameters from config"""
-        platform_key_params = []
-        for platform_config in PLATFORMS.values():
-            platform_key_params.extend([
-                platform_config.pixel_id_key,
-                platform_config.event_name_key
-            ])
-        return platform_key_params
+        return not params.keys().isdisjoint(indicators)
     
     def _detect_server_side_tracking(self, host: str, path: str, params: Dict[str, str], advanced_scoring: bool = False) -> Dict[str, Union[bool, str, int]]:
         """Unified server-side tracking detection based only on parameters."""
@@ -1368,42 +1613,47 @@ class UnifiedPlatformDetector:
         # Parameter analysis for sGTM
         gtm_id = params.get('gtm', '')
         has_gtm_container = bool(gtm_id and (
-            any(gtm_id.startswith(p) for p in SGTM_INDICATORS['gtm_id_prefixes']) or
+            gtm_id.startswith(_GTM_ID_PREFIXES) or
             len(gtm_id) > 10  # Hashed container IDs are typically long
         ))
         
         tid_value = params.get('tid', '')
-        has_tracking_id = tid_value and any(tid_value.startswith(p) for p in SGTM_INDICATORS['tracking_id_prefixes'])
+        has_tracking_id = tid_value and tid_value.startswith(_TRACKING_ID_PREFIXES)
         
-        # Enhanced scoring for sGTM
-        score = self._calculate_sgtm_score(params, has_gtm_container, has_tracking_id)
+        # Enhanced scoring for sGTM - the sGTM threshold settles the result, except when debug logs report the full score
+        score = self._calculate_sgtm_score(params, has_gtm_container, has_tracking_id,
+                                           stop_at=float("inf") if DEBUG_MODE else SGTM_SCORE_THRESHOLD)
         
         if DEBUG_MODE:
             unified_logger.log_debug(f"[SGTM SCORE] Host: {host}, Path: {path}, Score: {score}, GTM: {has_gtm_container}, TID: {has_tracking_id}")
         
         return {
             "is_server_side": score >= 1,
-            "platform": "sGTM" if score >= 3 else "Custom Tracking",
+            "platform": "sGTM" if score >= SGTM_SCORE_THRESHOLD else "Custom Tracking",
             "score": score
         }
     
-    def _calculate_sgtm_score(self, params: Dict[str, str], has_gtm_container: bool, has_tracking_id: bool) -> int:
-        """Calculate sGTM detection score based on parameters"""
-        score = 0
+    def _calculate_sgtm_score(self, params: Dict[str, str], has_gtm_container: bool, has_tracking_id: bool, stop_at: float = float("inf")) -> int:
+        """Calculate sGTM detection score based on parameters, returning early once it reaches stop_at"""
+        # Strongest indicators first so confirmed sGTM traffic stops after one or two checks
+        score = 4 if has_gtm_container else 0
+        if score >= stop_at: return score
+        if self._has_any_params(params, SGTM_INDICATORS['eventParams']): score += 3  # Event parameters are strong indicators
+        if score >= stop_at: return score
         
         # Core sGTM indicators
-        if has_gtm_container: score += 4
         if has_tracking_id: score += 2
         if self._count_matching_params(params, SGTM_INDICATORS['ga4_params']) >= 3: score += 2
-        if self._has_any_params(params, SGTM_INDICATORS['consent_params']): score += 1
         if self._count_matching_params(params, SGTM_INDICATORS['serverGtmParams']) >= 1: score += 2
+        if score >= stop_at: return score
         
         # Enhanced parameter detection
-        if self._has_any_params(params, SGTM_INDICATORS['eventParams']): score += 3  # Event parameters are strong indicators
         if self._count_matching_params(params, SGTM_INDICATORS['trackingParams']) >= 2: score += 2
+        if self._count_matching_params(params, SGTM_INDICATORS['ecommerceParams']) >= 2: score += 2
+        if score >= stop_at: return score
+        if self._has_any_params(params, SGTM_INDICATORS['consent_params']): score += 1
         if self._has_any_params(params, SGTM_INDICATORS['sessionParams']): score += 1
         if self._has_any_params(params, SGTM_INDICATORS['valueParams']): score += 1
-        if self._count_matching_params(params, SGTM_INDICATORS['ecommerceParams']) >= 2: score += 2
         if self._has_any_params(params, SGTM_INDICATORS['timestampParams']): score += 1
         
         # Legacy specific checks
@@ -1413,13 +1663,8 @@ class UnifiedPlatformDetector:
         return score
     
     def clear_cache(self):
-        """Clear detection cache and clean up dynamic hosts"""
-        if len(self.platform_cache) > 200:
-            # Keep most common platforms, clear the rest
-            common_platforms = {k: v for k, v in self.platform_cache.items() 
-                              if v in ["GA4", "Facebook", "TikTok", "Google Ads", "sGTM"]}
-            self.platform_cache.clear()
-            self.platform_cache.update(common_platforms)
+        """Clear detection cache (size is already bounded by LRU eviction in detect_platform)"""
+        self.platform_cache.clear()
     
     def is_tracking_request(self, flow: http.HTTPFlow) -> bool:
         """Check if a request is a tracking request based only on parameters."""
@@ -1434,21 +1679,14 @@ class UnifiedPlatformDetector:
         # More flexible path matching for tracking requests
         if host in ALL_HOSTS:
             # First try exact startswith matching
-            if any(path.startswith(tracking_path) for tracking_path in ALL_PATHS):
+            if path.startswith(_ALL_PATHS_PREFIXES):
                 return True
             
-            # Then try more flexible matching for common tracking patterns
-            for tracking_path in ALL_PATHS:
-                # Remove trailing slashes for comparison
-                clean_tracking_path = tracking_path.rstrip('/')
-                clean_request_path = path.rstrip('/').split('?')[0]  # Remove query params
-                
-                # Check if the path contains the tracking path segment
-                if (clean_tracking_path in clean_request_path or 
-                    clean_request_path.startswith(clean_tracking_path) or
-                    # Handle cases like "/api/v1/settings" matching "/api/"
-                    (clean_tracking_path.endswith('/') and clean_request_path.startswith(clean_tracking_path.rstrip('/')))):
-                    return True
+            # Then try more flexible matching for common tracking patterns - a contained segment
+            # also covers prefixes like "/api/v1/settings" matching "/api/"
+            clean_request_path = path.rstrip('/').split('?', 1)[0]  # Remove query params
+            if _contains_tracking_segment(clean_request_path):
+                return True
 
         # Debug logging for tracking request detection failures
         if DEBUG_MODE and host in ALL_HOSTS:
@@ -1461,6 +1699,10 @@ class UnifiedPlatformDetector:
         host = flow.request.pretty_host
         path = flow.request.path
         
+        # Detection is parameter-based: without a query string or POST body there are no params to match
+        if "?" not in path and not (flow.request.method == "POST" and flow.request.content):
+            return False
+        
         # Use unified detection logic from platform detector, which is now parameter-based
         params = self._get_all_params(flow)
         detection_result = self._detect_server_side_tracking(host, path, params, advanced_scoring=False)
@@ -1503,7 +1745,12 @@ def get_param_map_for_platform(platform: str) -> Dict[str, str]:
     return {'pixel_id': 'pixel_id', 'event': 'event_name', 'value': 'value',
             'currency': 'currency', 'url': 'page_url', 'ref': 'referrer'}
 
-def _format_pixel_id(pixel_id: str, platform: str) -> Dict[str, str]:
+@functools.lru_cache(maxsize=512)
+def _format_pixel_id(pixel_id: str, platform: str) -> Mapping[str, str]:
+    """Format pixel ID (cached - the same IDs fire on every hit, so the entry is read-only)"""
+    return types.MappingProxyType(_build_pixel_id_info(pixel_id, platform))
+
+def _build_pixel_id_info(pixel_id: str, platform: str) -> Dict[str, str]:
     """Format pixel ID using lookup rules"""
     if not pixel_id:
         return {"id": "", "type": "", "formatted": ""}
@@ -1511,14 +1758,14 @@ def _format_pixel_id(pixel_id: str, platform: str) -> Dict[str, str]:
     formatter = PLATFORM_ID_FORMATTERS.get(platform)
     
     if isinstance(formatter, dict):
-        # Handle prefix-based formatting (GA4, Google Ads)
-        for prefix, (type_name, short_name) in formatter.items():
-            if pixel_id.startswith(prefix):
-                return {
-                    "id": pixel_id,
-                    "type": type_name,
-                    "formatted": f"{pixel_id} ({short_name})"
-                }
+        # Handle prefix-based formatting (GA4, Google Ads) - every prefix ends at the first dash
+        if entry := formatter.get(pixel_id[:pixel_id.find("-") + 1]):
+            type_name, short_name = entry
+            return {
+                "id": pixel_id,
+                "type": type_name,
+                "formatted": f"{pixel_id} ({short_name})"
+            }
         # Special case for GA4 GTM containers
         if platform == "GA4" and len(pixel_id) > 10 and not pixel_id.startswith(("G-", "UA-")):
             return {
@@ -1557,34 +1804,68 @@ def _format_pixel_id(pixel_id: str, platform: str) -> Dict[str, str]:
 
 
 # Utility functions for common patterns
+_STATIC_ASSET_SUFFIXES = ('.js', '.html', '.css', '.js.map', '.css.map', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.woff', '.woff2', '.ttf', '.eot')
+_STATIC_ASSET_SUFFIX_LEN = max(map(len, _STATIC_ASSET_SUFFIXES))
+
 def _is_static_asset(path: str) -> bool:
     """Check if path is a static asset that should be excluded from processing"""
-    return (path.lower().endswith(('.js', '.html', '.css', '.js.map', '.css.map', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.woff', '.woff2', '.ttf', '.eot')) )
+    # Only the tail can match, so lowercase that instead of copying the whole path and query string
+    return path[-_STATIC_ASSET_SUFFIX_LEN:].lower().endswith(_STATIC_ASSET_SUFFIXES)
 
 def _extract_adwords_id(request_path: str) -> Optional[str]:
     """Extract AdWords ID from URL path patterns"""
-    patterns = [
-        r'/pagead/1p-conversion/(\d+)(?:/|\?|$)',
-        r'/pagead/conversion/(\d+)(?:/|\?|$)', 
-        r'/pagead/1p-user-list/(\d+)(?:/|\?|$)',
-        r'/ads/conversion/(\d+)(?:/|\?|$)'
-    ]
-    
-    for pattern in patterns:
-        if match := re.search(pattern, request_path):
-            return match.group(1)
-    return None
+    match = _ADWORDS_ID_RE.search(request_path)
+    return match.group(1) if match else None
+
+def _strip_request_metadata(data: Dict[str, str]) -> Dict[str, str]:
+    """Copy of the request params without the metadata keys added by _add_request_metadata"""
+    clean_data = data.copy()
+    for key in _REQUEST_METADATA_KEYS:
+        clean_data.pop(key, None)
+    return clean_data
+
+def _query_to_dict(query) -> Dict[str, str]:
+    """First-value-wins dict of a query MultiDictView, read through a single .fields snapshot"""
+    # dict(query) re-decodes the whole query string for every key lookup
+    params = {}
+    setdefault = params.setdefault
+    for key, value in query.fields:
+        setdefault(key, value)
+    return params
+
+def _parse_form_params(text: str) -> Dict[str, str]:
+    """URL-encoded form body as a dict - first value wins for repeated keys, blank values are dropped"""
+    # parse_qs semantics without building the per-key value lists
+    params = {}
+    setdefault = params.setdefault
+    for key, value in urllib.parse.parse_qsl(text):
+        setdefault(key, value)
+    return params
+
+def _json_scalar_to_str(value) -> str:
+    """Convert a JSON scalar to its parameter string (JSON-style booleans, empty for null)"""
+    value_type = type(value)
+    if value_type is str:
+        return value
+    if value_type is bool:
+        return "true" if value else "false"
+    if value is None:
+        return ""
+    return str(value)
 
 # Legacy functions - consolidated into unified system
 
 
-def process_marketing_pixel_event(data: Dict[str, str], platform: str, request_path: Optional[str] = None, request_url: Optional[str] = None, post_data: str = "", method: str = "") -> None:
+def process_marketing_pixel_event(data: Dict[str, str], platform: str, request_path: Optional[str] = None, request_url: Optional[str] = None, post_data: bytes = b"", method: str = "") -> None:
     """Process a marketing pixel event from any platform"""
     unified_logger.log_debug(f"Processing {platform} event with {len(data)} parameters")
     
-    # Get platform handler and extract identifiers
+    # Get platform handler and extract identifiers and platform-specific information in one pass
     handler = get_event_handler(platform)
-    pixel_id, event_name, event_type = handler.extract_identifiers(data)
+    param_map = get_param_map_for_platform(platform)
+    mapped_data = {param_map[platform_key]: data[platform_key] 
+                   for platform_key in param_map if platform_key in data}
+    pixel_id, event_name, event_type, extra_info = handler.extract_event(data, mapped_data)
     
     unified_logger.log_debug(f"{event_name}, {pixel_id}, {platform}")
     
@@ -1598,7 +1879,7 @@ def process_marketing_pixel_event(data: Dict[str, str], platform: str, request_p
             "message": f"Missing {platform} event name and pixel ID",
             "request_hash": request_hash
         }
-        clean_data = {k: v for k, v in data.items() if not k.startswith('_request_')}
+        clean_data = _strip_request_metadata(data)
         unified_logger.log_structured("custom_tracking", "not defined", error_event_data, 
                                       {"request_path": request_path, "raw_data": clean_data, "request_url": request_url})
         return
@@ -1607,12 +1888,6 @@ def process_marketing_pixel_event(data: Dict[str, str], platform: str, request_p
     if event_name == "Unknown" and pixel_id:
         unified_logger.log_debug(f"Warning: {platform} pixel_id found ({pixel_id}) but event_name is Unknown. Available params: {list(data.keys())}")
     
-    # Get parameter mapping and extract platform-specific information
-    param_map = get_param_map_for_platform(platform)
-    mapped_data = {param_map[platform_key]: data[platform_key] 
-                   for platform_key in param_map if platform_key in data}
-    extra_info = handler.extract_platform_info(data, mapped_data, event_name)
-    
     # Format property/account ID
     try:
         property_info = _format_pixel_id(pixel_id, platform)
@@ -1643,7 +1918,7 @@ def process_marketing_pixel_event(data: Dict[str, str], platform: str, request_p
     
     
     # Filter out internal request metadata and log
-    clean_data = {k: v for k, v in data.items() if not k.startswith('_request_')}
+    clean_data = _strip_request_metadata(data)
     unified_logger.log_structured("marketing_pixel_event", event_name, event_data, 
                                   {"request_path": request_path, "raw_data": clean_data, "request_url": request_url})
 
@@ -1660,7 +1935,12 @@ class UnifiedResponseProcessor:
         "application/javascript", "text/javascript",
         "application/x-javascript", "text/x-javascript"
     }
-    JS_PATH_PATTERNS = {'/gtm.js', '/gtag/js', '/analytics.js', '/ga.js', '/bat.js', '/uet.js'}
+    JS_PATH_PATTERNS = ('/gtm.js', '/gtag/js', '/analytics.js', '/ga.js', '/bat.js', '/uet.js')
+    # Host keywords of tracking domains outside ALL_HOSTS ("google" also covers googlesyndication)
+    TRACKING_DOMAIN_KEYWORDS = ('google', 'facebook', 'analytics', 'doubleclick')
+    REQUEST_TYPES = {"GET": "GET", "POST": "POST", "HEAD": "HEAD"}
+    
+    __slots__ = ("platform_detector", "logger")
     
     def __init__(self):
         self.platform_detector = platform_detector
@@ -1691,19 +1971,15 @@ class UnifiedResponseProcessor:
             pass
         return ""
     
-    def _is_javascript_content(self, flow: http.HTTPFlow) -> bool:
+    def _is_javascript_content(self, flow: http.HTTPFlow, content_type: str = None) -> bool:
         """Check if response content is JavaScript - optimized version"""
-        content_type = flow.response.headers.get("content-type", "").lower()
+        if content_type is None:
+            content_type = flow.response.headers.get("content-type", "")
+        content_type = content_type.lower()
         path = flow.request.path
         
-        # Parse content-type to get the main type and subtype
-        if ";" in content_type:
-            main_type = content_type.split(";")[0].strip()
-        else:
-            main_type = content_type.strip()
-        
-        # Check for exact JavaScript content types
-        if main_type in self.JS_CONTENT_TYPES:
+        # Check for exact JavaScript content types (main type without parameters)
+        if content_type.partition(";")[0].strip() in self.JS_CONTENT_TYPES:
             return True
         
         # Check if the request path ends with .js
@@ -1711,7 +1987,10 @@ class UnifiedResponseProcessor:
             return True
         
         # Check if the path contains common JavaScript patterns
-        return any(pattern in path for pattern in self.JS_PATH_PATTERNS)
+        for pattern in self.JS_PATH_PATTERNS:
+            if pattern in path:
+                return True
+        return False
     
     def _get_response_size(self, flow: http.HTTPFlow) -> str:
         """Get formatted response size"""
@@ -1731,14 +2010,16 @@ class UnifiedResponseProcessor:
         
         return headers_info
     
-    def _build_response_info(self, flow: http.HTTPFlow, is_js_content: bool = None) -> dict:
+    def _build_response_info(self, flow: http.HTTPFlow, is_js_content: bool = None, content_type: str = None) -> dict:
         """Build comprehensive response information - optimized to avoid repeated JS detection"""
+        if content_type is None:
+            content_type = flow.response.headers.get("content-type", "")
         if is_js_content is None:
-            is_js_content = self._is_javascript_content(flow)
+            is_js_content = self._is_javascript_content(flow, content_type)
             
         response_info = {
             "response_type": "JavaScript" if is_js_content else "Data",
-            "content_type": flow.response.headers.get("content-type", ""),
+            "content_type": content_type,
             "status_code": flow.response.status_code,
             "response_size": self._get_response_size(flow),
             "request_method": self._extract_request_type(flow)
@@ -1775,24 +2056,25 @@ class UnifiedResponseProcessor:
         
         # Detect platform and JavaScript content once
         platform = self.platform_detector.detect_platform(host, path, flow)
-        is_js_content = self._is_javascript_content(flow)
+        content_type = flow.response.headers.get("content-type", "")  # Header lookups scan all fields - read it once
+        is_js_content = self._is_javascript_content(flow, content_type)
         js_info = "Javascript" if is_js_content else None
         
         # Process tracking response and cookies
-        self._handle_tracking_response(flow, platform, is_js_content, js_info)
+        self._handle_tracking_response(flow, platform, is_js_content, js_info, content_type)
         self._handle_cookie_setting(flow)
     
     
-    def _handle_tracking_response(self, flow: http.HTTPFlow, platform: str, is_js_content: bool = None, js_info: Union[dict, str] = None) -> None:
+    def _handle_tracking_response(self, flow: http.HTTPFlow, platform: str, is_js_content: bool = None, js_info: Union[dict, str] = None, content_type: str = None) -> None:
         """Handle tracking response - optimized to avoid redundant JavaScript detection"""
         status_code = flow.response.status_code
         
         # Generate request hash for matching
-        post_data = flow.request.get_text() if flow.request.content else ""
+        post_data = flow.request.content or b""
         request_hash = _generate_request_hash(flow.request.url, post_data, flow.request.method)
         
         # Build response information (pass is_js_content to avoid recalculation)
-        response_info = self._build_response_info(flow, is_js_content)
+        response_info = self._build_response_info(flow, is_js_content, content_type)
         
         # Handle all responses (including JavaScript endpoints) through unified logging
         if self._is_error_status(status_code):
@@ -1895,29 +2177,23 @@ class UnifiedResponseProcessor:
     
     def _is_tracking_domain(self, host: str) -> bool:
         """Check if host is a tracking domain"""
-        return host in ALL_HOSTS or any(domain in host for domain in 
-                                       ['google', 'facebook', 'analytics', 'doubleclick', 'googlesyndication'])
+        if host in ALL_HOSTS:
+            return True
+        for keyword in self.TRACKING_DOMAIN_KEYWORDS:
+            if keyword in host:
+                return True
+        return False
     
     def _is_target_domain(self, host: str) -> bool:
         """Check if host is the target domain"""
-        if not TARGET_DOMAIN:
-            return False
-        try:
-            target_host = urllib.parse.urlparse(TARGET_DOMAIN).netloc
-            return host == target_host or host.endswith(f'.{target_host}')
-        except:
+        if not _TARGET_HOST:
             return False
+        return host == _TARGET_HOST or host.endswith(f'.{_TARGET_HOST}')
     
     def _extract_cookie_names(self, set_cookie_headers) -> List[str]:
         """Extract cookie names from Set-Cookie headers"""
-        cookies_info = []
-        for cookie_header in set_cookie_headers:
-            cookie_parts = cookie_header.split(';')
-            if cookie_parts:
-                cookie_name_value = cookie_parts[0].strip()
-                cookie_name = cookie_name_value.split('=')[0] if '=' in cookie_name_value else cookie_name_value
-                cookies_info.append(cookie_name)
-        return cookies_info
+        # One name per header (empty for malformed ones) - _log_cookie_setting pairs names with headers by index
+        return [cookie_header.partition(';')[0].strip().partition('=')[0] for cookie_header in set_cookie_headers]
     
     def _log_cookie_setting(self, host: str, path: str, cookies_info: List[str], 
                            is_tracking_domain: bool, set_cookie_headers, request_url: str) -> None:
@@ -2022,13 +2298,7 @@ class UnifiedResponseProcessor:
     
     def _extract_request_type(self, flow: http.HTTPFlow) -> str:
         """Extract request type from request"""
-        if flow.request.method == "GET":
-            return "GET"
-        elif flow.request.method == "POST":
-            return "POST"
-        elif flow.request.method == "HEAD":
-            return "HEAD"
-        return "UNKNOWN"
+        return self.REQUEST_TYPES.get(flow.request.method, "UNKNOWN")
 
 
 # Global response processor instance
@@ -2043,18 +2313,31 @@ def response(flow: http.HTTPFlow) -> None:
 class UnifiedRequestProcessor:
     """Unified request processing pipeline"""
     
+    __slots__ = ("platform_detector", "_error_log_times", "_flatten_stack", "_extractors")
+    
     def __init__(self):
         self.platform_detector = platform_detector
+        self._error_log_times: Dict[tuple, float] = {}
+        self._flatten_stack: List[tuple] = []
+        
+        # Body extractors specialized per (platform, method); anything else uses _extract_generic_body
+        self._extractors = {("GA4", "POST"): self._extract_ga4_body}
+        for platform, needs_body in PLATFORM_NEEDS_BODY.items():
+            if not needs_body:
+                self._extractors[(platform, "POST")] = self._extract_url_only
     
     def process_request(self, flow: http.HTTPFlow) -> None:
         """Unified request processing for all HTTP methods"""
+        # Request path/url/method are computed properties on mitmproxy requests - read them once per flow
+        request = flow.request
+        
         # Fast path exclusion for non-relevant files and static assets
-        path = flow.request.path
+        path = request.path
         if _is_static_asset(path):
             return
         
         # Exclude Google APIs that are not tracking related
-        host = flow.request.pretty_host
+        host = request.pretty_host
         
         # Use optimized tracking check from platform detector
         if not self.platform_detector.is_tracking_request(flow):
@@ -2066,95 +2349,163 @@ class UnifiedRequestProcessor:
         try:
             request_data = self._extract_request_data(flow, platform)
             
-            # Get POST data for hash generation
-            post_data = flow.request.get_text() if flow.request.content else ""
+            # Raw POST body for hash generation - hashing the bytes avoids decoding the body again
+            post_data = request.content or b""
+            request_url, method = request.url, request.method
             
             # Process single request or batch
-            if isinstance(request_data, list):
-                # Handle batch requests (like GA4 JSON batches)
-                for data in request_data:
-                    process_marketing_pixel_event(data, platform, flow.request.path, flow.request.url, post_data, flow.request.method)
-            else:
+            if isinstance(request_data, dict):
                 # Handle single request
-                process_marketing_pixel_event(request_data, platform, flow.request.path, flow.request.url, post_data, flow.request.method)
-        
-        except Exception as e:
-            unified_logger.log_error(f"PARSE_ERROR: {str(e)[:100]}")
-    
-    def _extract_request_data(self, flow: http.HTTPFlow, platform: str) -> Union[Dict[str, str], List[Dict[str, str]]]:
+                process_marketing_pixel_event(request_data, platform, path, request_url, post_data, method)
+            else:
+                # Handle batch requests (like GA4 JSON batches), one event dict at a time
+                for data in request_data:
+                    process_marketing_pixel_event(data, platform, path, request_url, post_data, method)
+        
+        except (json.JSONDecodeError, UnicodeDecodeError, KeyError, ValueError, TypeError, AttributeError) as e:
+            # Malformed payloads (including wrongly shaped GA4 batches) end up here; anything else
+            # propagates to mitmproxy, which reports addon errors itself
+            self._log_parse_error(e)
+    
+    def _log_parse_error(self, error: Exception) -> None:
+        """Log parse errors, rate-limited to one line per distinct error message per interval"""
+        error_key = (type(error).__name__, str(error)[:100])
+        now = time.monotonic()
+        error_log_times = self._error_log_times
+        if now - error_log_times.get(error_key, 0.0) < PARSE_ERROR_LOG_INTERVAL:
+            return
+        if len(error_log_times) >= PARSE_ERROR_LOG_KEYS_MAX:
+            # Messages often embed offsets or values - forget the ones whose interval has passed
+            for key, logged_at in list(error_log_times.items()):
+                if now - logged_at >= PARSE_ERROR_LOG_INTERVAL:
+                    del error_log_times[key]
+        error_log_times[error_key] = now
+        unified_logger.log_error(f"PARSE_ERROR: {error_key[0]}: {error_key[1]}")
+    
+    def _extract_request_data(self, flow: http.HTTPFlow, platform: str) -> Union[Dict[str, str], Iterator[Dict[str, str]]]:
         """Extract request data from GET/POST unified"""
-        # Start with URL parameters
-        url_params = dict(flow.request.query)
-        
-        # Add request metadata for platform handlers (will be filtered out of raw_data before logging)
-        url_params["_request_path"] = flow.request.path
-        url_params["_request_host"] = flow.request.pretty_host
-        url_params["_request_url"] = flow.request.url
-        
-        if flow.request.method == "GET":
-            return url_params
-        
-        # Handle POST requests
-        if not flow.request.content:
-            return url_params
-        
-        raw_data = flow.request.get_text()
-        
-        # Try to parse as JSON first (for all platforms)
-        if raw_data.strip().startswith(('{', '[')):
+        # GET requests and empty bodies only carry URL parameters
+        method = flow.request.method
+        if method == "GET" or not flow.request.content:
+            return self._extract_url_only(flow)
+        
+        # Platform-specialized body extractor, generic JSON/form parsing otherwise
+        extractor = self._extractors.get((platform, method), self._extract_generic_body)
+        return extractor(flow)
+    
+    def _get_url_params(self, flow: http.HTTPFlow) -> Dict[str, str]:
+        """Copy URL parameters (skip the query parse when there is no query string)"""
+        return _query_to_dict(flow.request.query) if "?" in flow.request.path else {}
+    
+    def _extract_url_only(self, flow: http.HTTPFlow) -> Dict[str, str]:
+        """Extract URL parameters, ignoring any request body"""
+        return self._add_request_metadata(self._get_url_params(flow), flow)
+    
+    def _extract_ga4_body(self, flow: http.HTTPFlow) -> Union[Dict[str, str], Iterator[Dict[str, str]]]:
+        """Extract GA4 POST data, expanding JSON batch requests into one parameter dict per event"""
+        url_params = self._get_url_params(flow)
+        json_data = self._load_json_body(flow)
+        
+        if isinstance(json_data, dict) and isinstance(json_data.get('events'), list):
+            # Yield processed events lazily - each copies url_params, so handlers still see the request metadata
+            # (e.g. _request_path for /td and ccm classification)
+            url_params = self._add_request_metadata(url_params, flow)
+            return (process_json_event(json_data, event, url_params) for event in json_data['events'])
+        
+        return self._merge_body_params(flow, url_params, json_data)
+    
+    def _extract_generic_body(self, flow: http.HTTPFlow) -> Dict[str, str]:
+        """Extract POST data as flattened JSON or URL-encoded form parameters"""
+        return self._merge_body_params(flow, self._get_url_params(flow), self._load_json_body(flow))
+    
+    def _load_json_body(self, flow: http.HTTPFlow):
+        """Parse the request body as JSON, returning _NOT_JSON for anything else
+
+        orjson reads integers wider than 64 bits as floats, so such IDs lose precision when it is installed.
+        """
+        # Sniff the first byte, only stripping the body when it actually starts with whitespace
+        content = flow.request.content
+        first_byte = content[:1]
+        if first_byte in b" \t\r\n":
+            first_byte = content.lstrip()[:1]
+        if first_byte not in (b"{", b"["):
+            return _NOT_JSON
+        
+        if orjson is not None:
             try:
-                json_data = json.loads(raw_data)
-                
-                # Handle GA4 JSON batch requests specifically
-                if platform == "GA4" and isinstance(json_data, dict) and 'events' in json_data and isinstance(json_data['events'], list):
-                    # Return batch of processed events
-                    return [process_json_event(json_data, event, url_params) for event in json_data['events']]
-                
-                # Handle generic JSON for other platforms
-                else:
-                    # Flatten JSON data to parameters
-                    flattened_params = self._flatten_json_to_params(json_data)
-                    url_params.update(flattened_params)
-                    return url_params
-                    
+                # orjson parses the UTF-8 body bytes directly; its JSONDecodeError subclasses json's
+                return orjson.loads(content)
             except json.JSONDecodeError:
-                # If JSON parsing fails, continue to URL-encoded parsing
+                # Invalid JSON, or a body in another charset - retry on the text decoded per the request charset
                 pass
         
-        # URL-encoded POST requests (fallback)
         try:
-            post_data = urllib.parse.parse_qs(raw_data)
-            post_data = {k: (v[0] if v else "") for k, v in post_data.items()}
-            url_params.update(post_data)
-            return url_params
-        except Exception:
-            return url_params
-    
-    def _flatten_json_to_params(self, json_data: Union[Dict, List, str, int, float, bool], prefix: str = "") -> Dict[str, str]:
-        """Flatten JSON data into parameter dictionary for non-GA4 platforms"""
-        params = {}
-        
-        if isinstance(json_data, dict):
-            for key, value in json_data.items():
-                new_key = f"{prefix}.{key}" if prefix else key
-                if isinstance(value, (dict, list)):
-                    params.update(self._flatten_json_to_params(value, new_key))
-                else:
-                    params[new_key] = str(value) if value is not None else ""
-        
-        elif isinstance(json_data, list):
-            for i, item in enumerate(json_data):
-                new_key = f"{prefix}[{i}]" if prefix else f"item_{i}"
-                if isinstance(item, (dict, list)):
-                    params.update(self._flatten_json_to_params(item, new_key))
-                else:
-                    params[new_key] = str(item) if item is not None else ""
-        
+            return json.loads(flow.request.get_text())
+        except json.JSONDecodeError:
+            # If JSON parsing fails, fall back to URL-encoded parsing
+            return _NOT_JSON
+    
+    def _merge_body_params(self, flow: http.HTTPFlow, url_params: Dict[str, str], json_data) -> Dict[str, str]:
+        """Merge flattened JSON, or URL-encoded form data, into the URL parameters"""
+        if json_data is not _NOT_JSON:
+            # Leaves are written straight into the URL params - same result as update(), without the interim dict
+            self._flatten_json_to_params(json_data, params=url_params)
         else:
-            # Handle primitive values
-            key = prefix if prefix else "value"
-            params[key] = str(json_data) if json_data is not None else ""
+            url_params.update(_parse_form_params(flow.request.get_text()))
+        return self._add_request_metadata(url_params, flow)
+    
+    def _add_request_metadata(self, params: Dict[str, str], flow: http.HTTPFlow) -> Dict[str, str]:
+        """Add request metadata for platform handlers (filtered out of raw_data before logging)"""
+        # mitmproxy always decodes Request.path to str, so handlers can test it with `in` directly
+        params["_request_path"] = flow.request.path
+        params["_request_host"] = flow.request.pretty_host
+        params["_request_url"] = flow.request.url
+        return params
+    
+    def _flatten_json_to_params(self, json_data: Union[Dict, List, str, int, float, bool], prefix: str = "", params: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """Flatten JSON data into parameter dictionary for non-GA4 platforms, writing into params when given"""
+        if params is None:
+            params = {}
+        
+        # Depth-first walk over a reused work stack; keys are joined from their segments only at the leaves.
+        # Children are pushed in reverse so leaves come out in document order.
+        stack = self._flatten_stack
+        stack.clear()
+        stack.append((json_data, (prefix,) if prefix else ()))
+        
+        # Bind hot-loop lookups once per call
+        push, pop, join, to_str = stack.append, stack.pop, "".join, _json_scalar_to_str
+        budget, max_depth = JSON_FLATTEN_MAX_NODES, JSON_FLATTEN_MAX_DEPTH
+        
+        while stack:
+            # Cap total work so one pathological body cannot stall every other flow
+            budget -= 1
+            if budget < 0:
+                params["_truncated"] = "1"
+                break
+            
+            node, key_parts = pop()
+            node_type = type(node)
+            
+            if (node_type is dict or node_type is list) and len(key_parts) >= max_depth:
+                params["_truncated"] = "1"
+            
+            # json.loads only produces exact dicts and lists, so skip the isinstance MRO walk
+            elif node_type is dict:
+                # Children past the remaining budget would never be popped, so don't stack them
+                items = node.items() if len(node) <= budget else list(node.items())[:budget + 1]
+                for key, value in reversed(items):
+                    push((value, key_parts + ((f".{key}" if key_parts else str(key)),)))
+            
+            elif node_type is list:
+                for i in range(min(len(node), budget + 1) - 1, -1, -1):
+                    push((node[i], key_parts + ((f"[{i}]" if key_parts else f"item_{i}"),)))
+            
+            else:
+                # Handle primitive values
+                params[join(key_parts) if key_parts else "value"] = to_str(node)
         
+        stack.clear()
         return params
 
 
@@ -2163,4 +2514,9 @@ request_processor = UnifiedRequestProcessor()
 
 def request(flow: http.HTTPFlow) -> None:
     """Main request handler with unified processing"""
-    request_processor.process_request(flow)
\ No newline at end of file
+    request_processor.process_request(flow)
+
+
+def done() -> None:
+    """Flush buffered log output and release the log socket/thread when mitmproxy unloads the script"""
+    unified_logger.close()
\ No newline at end of file
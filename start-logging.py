@@ -7,6 +7,9 @@ import sys
 import threading
 import queue
 import socket
+import tempfile
+import shutil
+import atexit
 import websockets
 import argparse
 import urllib.parse
@@ -477,6 +480,39 @@ def find_available_port():
         s.bind(('127.0.0.1', 0))
         return s.getsockname()[1]
 
+def start_structured_log_listener():
+    """Listen on a Unix socket for structured logs from the mitmproxy script, return its path"""
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    
+    socket_dir = tempfile.mkdtemp(prefix='ga4-logger-')
+    socket_path = os.path.join(socket_dir, 'structured.sock')
+    # Remove the socket and its temp directory on shutdown so runs don't leave them behind
+    atexit.register(shutil.rmtree, socket_dir, ignore_errors=True)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        listener.bind(socket_path)
+        listener.listen()
+    except OSError as e:
+        listener.close()
+        print(f"⚠️ Structured log socket unavailable, falling back to stdout: {e}", flush=True)
+        return None
+    
+    def read_structured(conn):
+        # One '[STRUCTURED] ...' line per log entry - forwarded as-is, no prefix check needed
+        with conn, conn.makefile('r', encoding='utf-8', newline='\n') as stream:
+            for line in stream:
+                send_to_websocket(line.rstrip('\n'))
+    
+    def accept_loop():
+        # mitmproxy reconnects whenever it reloads the script
+        while True:
+            conn, _ = listener.accept()
+            threading.Thread(target=read_structured, args=(conn,), daemon=True).start()
+    
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return socket_path
+
 def start_mitmproxy():
     """Start mitmproxy subprocess and capture output"""
     mitmproxy_port = find_available_port()
@@ -493,6 +529,11 @@ def start_mitmproxy():
     if TARGET_DOMAIN:
         env['TARGET_DOMAIN'] = TARGET_DOMAIN
     
+    # Structured logs get their own channel instead of being picked out of stdout
+    structured_socket = start_structured_log_listener()
+    if structured_socket:
+        env['STRUCTURED_LOG_SOCKET'] = structured_socket
+    
     try:
         proc = subprocess.Popen(
             cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,